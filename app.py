@@ -1,27 +1,69 @@
+import io
 import os
 import json
-from flask import Flask, request, render_template, redirect, url_for, session, flash
-from werkzeug.utils import secure_filename
-from dotenv import load_dotenv
+import time
+import uuid
+import secrets
+import itertools
+from flask import Flask, request, render_template, redirect, url_for, flash, jsonify, abort, Response, send_file
 
-# Importar la lógica de Spotify
-from spotify_logic import process_tracks
+# Importar la cola de trabajos. La lógica de Spotify (spotipy, planificador,
+# cachés) se importa en la primera importación que se envía: importarla cuesta
+# más que todo lo demás y los procesos que solo sirven páginas o estado no la necesitan.
+from jobs import get_job_queue, STATUS_QUEUED, STATUS_RUNNING, RESULT_PAGE_SIZE
+from track_ingest import iter_tracks
+from metrics import get_metrics, profile_path
 
-# Cargar variables de entorno iniciales (si existen)
-load_dotenv()
+# Fichero (dentro de la carpeta instance/) con la clave secreta compartida por
+# todos los procesos cuando no se define FLASK_SECRET_KEY
+SECRET_KEY_FILE = "secret_key"
 
-app = Flask(__name__)
-# Necesitamos una clave secreta para usar sesiones en Flask
-app.secret_key = os.urandom(24)
+# Intervalo de sondeo del stream de eventos y de envío de keep-alive (segundos)
+SSE_POLL_INTERVAL = 0.5
+SSE_KEEPALIVE_INTERVAL = 15
 
-# Carpeta para subir archivos temporalmente
-UPLOAD_FOLDER = 'uploads'
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Extensiones aceptadas para el archivo de tracks (array JSON o NDJSON)
+ALLOWED_EXTENSIONS = ('.json', '.ndjson', '.jsonl')
 
-# Asegurarse de que la carpeta de subidas exista
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+def _detach_upload(file):
+    """
+    Toma posesión del stream de un archivo subido. Werkzeug cierra los archivos
+    del request al terminar la petición, pero el trabajo lo sigue leyendo en
+    segundo plano; se le deja un stream vacío en su lugar.
+    """
+    stream = file.stream
+    file.stream = io.BytesIO()
+    return stream
+
+def _read_and_close(tracks, stream):
+    """Produce los tracks y cierra el stream de origen al terminar (o al abandonarse)."""
+    try:
+        yield from tracks
+    finally:
+        stream.close()
+
+def _open_tracks(stream):
+    """
+    Retorna los tracks del stream para leerlos de forma incremental desde el trabajo.
+    Valida el formato leyendo el primer track antes de encolarlo (lanza ValueError
+    y cierra el stream si no es válido); los errores posteriores se reportan en
+    el resultado del trabajo.
+    """
+    tracks_iter = iter_tracks(stream)
+    try:
+        first_track = next(tracks_iter, None)
+    except ValueError:
+        stream.close()
+        raise
+    if first_track is None:
+        stream.close()
+        return []
+    return _read_and_close(itertools.chain([first_track], tracks_iter), stream)
+
+# ==========================
+#   Vistas (las URLs se registran en create_app)
+# ==========================
 
-@app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
         # Recoger datos del formulario
@@ -35,6 +77,9 @@ def index():
         track_source = request.form.get('track_source') # 'file' or 'paste'
         json_content_paste = request.form.get('json_content')
         duplicate_option = request.form.get('duplicate_option', 'add_all') # 'add_all' or 'add_new'
+        resume_job_id = request.form.get('resume_job_id') # Importación fallida a reanudar (opcional)
+        # Perfilado del trabajo (cProfile), activable por petición con el campo o el parámetro 'profile'
+        profile = (request.form.get('profile') or request.args.get('profile')) in ('1', 'true', 'on')
 
         # Validar credenciales básicas
         if not all([client_id, client_secret, redirect_uri]):
@@ -49,10 +94,19 @@ def index():
             flash("Por favor, introduce la URL de la playlist existente.", "error")
             return redirect(url_for('index'))
 
-        # Manejar fuente de tracks (archivo o texto pegado)
-        tracks_data = None
-        filepath_to_remove = None # Para borrar el archivo si se subió
+        # Cada importación guarda su avance en un checkpoint; al reanudar se reutiliza
+        # el de la importación original para no repetir búsquedas ni lotes ya añadidos.
+        checkpoint_id = uuid.uuid4().hex
+        if resume_job_id:
+            resumed_job = get_job_queue().store.get(resume_job_id)
+            if not resumed_job:
+                flash("No se encontró la importación que se quiere reanudar.", "error")
+                return redirect(url_for('index'))
+            checkpoint_id = resumed_job['meta'].get('checkpoint_id') or resume_job_id
 
+        # Manejar fuente de tracks (archivo o texto pegado).
+        # Los tracks se leen de forma incremental: el trabajo empieza a buscar
+        # mientras el resto de la entrada todavía se está leyendo.
         if track_source == 'file':
             if 'json_file' not in request.files:
                 flash('No se encontró el archivo JSON.', "error")
@@ -61,82 +115,57 @@ def index():
             if file.filename == '':
                 flash('No se seleccionó ningún archivo JSON.', "error")
                 return redirect(url_for('index'))
-
-            if file and file.filename.endswith('.json'):
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                filepath_to_remove = filepath # Marcar para borrar después
-
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        tracks_data = json.load(f)
-                except json.JSONDecodeError:
-                    flash("Error al leer el archivo JSON. Asegúrate de que tenga el formato correcto.", "error")
-                    if filepath_to_remove and os.path.exists(filepath_to_remove):
-                        os.remove(filepath_to_remove)
-                    return redirect(url_for('index'))
-                except Exception as e:
-                     flash(f"Ocurrió un error inesperado al leer el archivo: {e}", "error")
-                     if filepath_to_remove and os.path.exists(filepath_to_remove):
-                         os.remove(filepath_to_remove)
-                     return redirect(url_for('index'))
-            else:
-                 flash("Por favor, sube un archivo .json válido.", "error")
+            if not file.filename.lower().endswith(ALLOWED_EXTENSIONS):
+                 flash("Por favor, sube un archivo .json o .ndjson válido.", "error")
                  return redirect(url_for('index'))
+            tracks_stream = _detach_upload(file)
 
         elif track_source == 'paste':
             if not json_content_paste:
                  flash("Por favor, pega el contenido JSON de los tracks.", "error")
                  return redirect(url_for('index'))
-            try:
-                tracks_data = json.loads(json_content_paste)
-                if not isinstance(tracks_data, list): # Simple validación de formato
-                     raise ValueError("El JSON debe ser una lista de objetos.")
-            except json.JSONDecodeError:
-                flash("Error al decodificar el JSON pegado. Asegúrate de que el formato sea correcto.", "error")
-                return redirect(url_for('index'))
-            except ValueError as ve:
-                 flash(f"Error en el contenido JSON: {ve}", "error")
-                 return redirect(url_for('index'))
-            except Exception as e:
-                 flash(f"Ocurrió un error inesperado al procesar el JSON pegado: {e}", "error")
-                 return redirect(url_for('index'))
+            tracks_stream = io.StringIO(json_content_paste)
 
         else:
             # Esto no debería ocurrir si el HTML está bien
              flash("Selecciona una fuente para los tracks (archivo o pegar).", "error")
              return redirect(url_for('index'))
 
-        # Si llegamos aquí, tenemos tracks_data
-        if tracks_data is None:
-            flash("No se pudieron obtener los datos de los tracks.", "error")
-            if filepath_to_remove and os.path.exists(filepath_to_remove): # Limpieza si hubo error antes
-                os.remove(filepath_to_remove)
+        try:
+            tracks_data = _open_tracks(tracks_stream)
+        except ValueError as ve:
+            flash(f"Error al leer el JSON de los tracks. Asegúrate de que el formato sea correcto: {ve}", "error")
             return redirect(url_for('index'))
 
-        # Limpiar archivo subido si existe, ya hemos leído su contenido
-        if filepath_to_remove and os.path.exists(filepath_to_remove):
-            os.remove(filepath_to_remove)
-
-        # Llamar a la lógica de Spotify
-        result = process_tracks(
-            client_id=client_id,
-            client_secret=client_secret,
-            redirect_uri=redirect_uri,
-            tracks_data=tracks_data,
-            playlist_name=playlist_name if playlist_option == 'new' else None,
-            playlist_description=playlist_description if playlist_option == 'new' else None, # Pasar descripción
-            playlist_url=playlist_url if playlist_option == 'existing' else None,
-            duplicate_option=duplicate_option if playlist_option == 'existing' else 'add_all' # Pasar opción de duplicados solo si es relevante
+        # Encolar la lógica de Spotify como trabajo en segundo plano
+        from spotify_logic import process_tracks
+        job_id = get_job_queue().submit(
+            process_tracks,
+            dict(
+                client_id=client_id,
+                client_secret=client_secret,
+                redirect_uri=redirect_uri,
+                tracks_data=tracks_data,
+                playlist_name=playlist_name if playlist_option == 'new' else None,
+                playlist_description=playlist_description if playlist_option == 'new' else None, # Pasar descripción
+                playlist_url=playlist_url if playlist_option == 'existing' else None,
+                duplicate_option=duplicate_option if playlist_option == 'existing' else 'add_all', # Pasar opción de duplicados solo si es relevante
+                checkpoint_id=checkpoint_id
+            ),
+            meta={
+                "playlist_name": playlist_name if playlist_option == 'new' else None,
+                "playlist_url": playlist_url if playlist_option == 'existing' else None,
+                "tracks_count": len(tracks_data) if isinstance(tracks_data, list) else None,
+                "checkpoint_id": checkpoint_id,
+                "resumed_from": resume_job_id
+            },
+            profile=profile
         )
 
-        if "error" in result:
-            flash(f"Error en el proceso de Spotify: {result['error']}", "error")
-        else:
-            # Guardar resultado en sesión para mostrar en la página de resultados
-            session['result'] = result
-            return redirect(url_for('results'))
+        # Los clientes de API reciben el ID del trabajo; el navegador va a la página de resultados
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(job_id=job_id, status_url=url_for('job_status', job_id=job_id)), 202
+        return redirect(url_for('results', job_id=job_id))
 
     # Método GET: mostrar el formulario
     # Cargar credenciales desde .env si existen, para pre-rellenar el formulario
@@ -145,19 +174,132 @@ def index():
         'client_secret': os.getenv('SPOTIFY_CLIENT_SECRET', ''),
         'redirect_uri': os.getenv('SPOTIFY_REDIRECT_URI', '')
     }
-    return render_template('index.html', credentials=initial_credentials)
+    return render_template('index.html', credentials=initial_credentials, resume_job_id=request.args.get('resume'))
+
+def resolve():
+    """
+    Resuelve tracks sin crear ni modificar ninguna playlist (ver spotify_logic.resolve_tracks).
+    Acepta el array JSON o NDJSON como cuerpo de la petición, con las credenciales
+    de la aplicación del servidor (SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET), o un
+    formulario con client_id, client_secret y json_file o json_content.
+    Responde 202 con el ID del trabajo; el resultado (resolved_tracks con uri,
+    tier y confidence de cada track, paginado) se lee en /jobs/<id>/result.
+    """
+    if request.form or request.files:
+        client_id = request.form.get('client_id') or os.getenv('SPOTIFY_CLIENT_ID')
+        client_secret = request.form.get('client_secret') or os.getenv('SPOTIFY_CLIENT_SECRET')
+        file = request.files.get('json_file')
+        if file and file.filename:
+            tracks_stream = _detach_upload(file)
+        elif request.form.get('json_content'):
+            tracks_stream = io.StringIO(request.form['json_content'])
+        else:
+            return jsonify(error="Envía los tracks en json_file o json_content."), 400
+    else:
+        client_id = os.getenv('SPOTIFY_CLIENT_ID')
+        client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
+        # El cuerpo se copia: el trabajo lo lee cuando la petición ya terminó
+        tracks_stream = io.BytesIO(request.get_data())
+    if not client_id or not client_secret:
+        tracks_stream.close()
+        return jsonify(error="Faltan las credenciales de Spotify (client_id y client_secret)."), 400
+    try:
+        tracks_data = _open_tracks(tracks_stream)
+    except ValueError as ve:
+        return jsonify(error=f"Error al leer el JSON de los tracks: {ve}"), 400
+
+    from spotify_logic import resolve_tracks
+    job_id = get_job_queue().submit(
+        resolve_tracks,
+        dict(client_id=client_id, client_secret=client_secret, tracks_data=tracks_data),
+        meta={"mode": "resolve", "tracks_count": len(tracks_data) if isinstance(tracks_data, list) else None},
+        profile=request.args.get('profile') in ('1', 'true', 'on')
+    )
+    return jsonify(job_id=job_id, status_url=url_for('job_status', job_id=job_id),
+                   result_url=url_for('job_result', job_id=job_id)), 202
 
-@app.route('/results')
-def results():
-    result = session.pop('result', None)
-    if not result:
-        # Si no hay resultados en la sesión, redirigir a la página principal
+def results(job_id=None):
+    store = get_job_queue().store
+    job = store.get(job_id) if job_id else None
+    if not job:
+        # Si el trabajo no existe, redirigir a la página principal
         return redirect(url_for('index'))
-    return render_template('results.html', result=result)
+    # Mientras el trabajo está en proceso no hay resultado y la plantilla se recarga sola
+    # Las listas de tracks no encontrados y dudosos se muestran por páginas
+    result = store.get_result(job_id, page=request.args.get('page', default=1, type=int))
+    path = profile_path(job_id)
+    profile_url = url_for('job_profile', job_id=job_id) if path and os.path.exists(path) else None
+    return render_template('results.html', job=job, result=result, profile_url=profile_url)
+
+def job_status(job_id):
+    job = get_job_queue().store.get(job_id)
+    if not job:
+        abort(404)
+    job['result_url'] = url_for('job_result', job_id=job_id)
+    path = profile_path(job_id)
+    if path and os.path.exists(path):
+        job['profile_url'] = url_for('job_profile', job_id=job_id)
+    return jsonify(job)
+
+def job_profile(job_id):
+    """Descarga el perfil cProfile del trabajo (si se pidió al enviarlo y ya terminó)."""
+    path = profile_path(job_id)
+    if not get_job_queue().store.get(job_id) or not path or not os.path.exists(path):
+        abort(404)
+    return send_file(os.path.abspath(path), mimetype='application/octet-stream',
+                     as_attachment=True, download_name=f"{job_id}.prof")
+
+def metrics():
+    """Métricas del proceso en el formato de texto de Prometheus."""
+    return Response(get_metrics().render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+def job_result(job_id):
+    store = get_job_queue().store
+    job = store.get(job_id)
+    if not job:
+        abort(404)
+    if job['status'] in (STATUS_QUEUED, STATUS_RUNNING):
+        # Aún no hay resultado: indicar dónde consultar el estado
+        return jsonify(job_id=job_id, status=job['status'], status_url=url_for('job_status', job_id=job_id)), 202
+    # Las listas por track (not_found_tracks, low_confidence_tracks, resolved_tracks) van paginadas (?page=N&per_page=M)
+    return jsonify(store.get_result(job_id,
+                                    page=request.args.get('page', default=1, type=int),
+                                    per_page=request.args.get('per_page', default=RESULT_PAGE_SIZE, type=int)))
+
+def job_events(job_id):
+    """Stream Server-Sent Events con el progreso del trabajo hasta que termine."""
+    store = get_job_queue().store
+    if not store.get(job_id):
+        abort(404)
+    # Un navegador que se reconecta envía el último evento recibido
+    last_seq = request.headers.get('Last-Event-ID', default=0, type=int)
+
+    def stream(last_seq):
+        idle = 0.0
+        while True:
+            # Leer el estado antes que los eventos: si ya terminó, todos sus eventos están guardados
+            finished = store.get(job_id)['status'] not in (STATUS_QUEUED, STATUS_RUNNING)
+            events = store.get_events(job_id, last_seq)
+            for seq, event in events:
+                last_seq = seq
+                yield f"id: {seq}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+            if events:
+                idle = 0.0
+                continue
+            if finished:
+                yield f"event: end\ndata: {json.dumps({'status': store.get(job_id)['status']})}\n\n"
+                return
+            time.sleep(SSE_POLL_INTERVAL)
+            idle += SSE_POLL_INTERVAL
+            if idle >= SSE_KEEPALIVE_INTERVAL:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+
+    return Response(stream(last_seq), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # Ruta para manejar la autenticación de Spotify (callback)
 # Esta ruta es necesaria para que SpotifyOAuth funcione
-@app.route('/callback')
 def callback():
     # Spotipy maneja el intercambio de código por token automáticamente
     # a través de su auth_manager cuando se hace la primera llamada API.
@@ -167,7 +309,66 @@ def callback():
     flash("Autenticación con Spotify completada. Puedes volver a enviar el formulario.", "info")
     return redirect(url_for('index'))
 
+# ==========================
+#   Fábrica de la aplicación
+# ==========================
+
+def create_app(config: dict = None, load_env: bool = True) -> Flask:
+    """
+    Crea la aplicación Flask. Es el punto de entrada de `flask run`, de
+    `python app.py` y de los servidores WSGI (ver wsgi.py).
+    - Con load_env carga el archivo .env (sin sobrescribir variables ya definidas).
+    - La configuración se lee de las variables FLASK_* (p. ej. FLASK_SECRET_KEY)
+      y después de config.
+    - Sin SECRET_KEY configurada se usa la guardada en instance/secret_key,
+      creándola la primera vez, de modo que todos los procesos de la misma
+      máquina firman las sesiones con la misma clave.
+    """
+    if load_env:
+        from dotenv import load_dotenv
+        load_dotenv()
+    app = Flask(__name__)
+    app.config.from_prefixed_env()
+    if config:
+        app.config.update(config)
+    if not app.config.get("SECRET_KEY"):
+        app.config["SECRET_KEY"] = _shared_secret_key(app.instance_path)
+
+    app.add_url_rule('/', 'index', index, methods=['GET', 'POST'])
+    app.add_url_rule('/resolve', 'resolve', resolve, methods=['POST'])
+    app.add_url_rule('/results', 'results', results)
+    app.add_url_rule('/results/<job_id>', 'results', results)
+    app.add_url_rule('/jobs/<job_id>', 'job_status', job_status)
+    app.add_url_rule('/jobs/<job_id>/profile', 'job_profile', job_profile)
+    app.add_url_rule('/jobs/<job_id>/result', 'job_result', job_result)
+    app.add_url_rule('/jobs/<job_id>/events', 'job_events', job_events)
+    app.add_url_rule('/metrics', 'metrics', metrics)
+    app.add_url_rule('/callback', 'callback', callback)
+    return app
+
+def _shared_secret_key(instance_path: str) -> str:
+    """
+    Retorna la clave guardada en instance_path, creándola si no existe.
+    La clave se escribe en un temporal y se enlaza con os.link, que falla si
+    otro proceso ya la creó: todos los procesos que arrancan a la vez acaban
+    leyendo la misma clave completa.
+    """
+    path = os.path.join(instance_path, SECRET_KEY_FILE)
+    if not os.path.exists(path):
+        os.makedirs(instance_path, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(temp_path)
+    with open(path) as f:
+        return f.read().strip()
+
 if __name__ == '__main__':
     # Usar un puerto diferente al 8080 si ese es tu redirect URI
     # para evitar conflictos.
-    app.run(debug=True, port=5000) 
\ No newline at end of file
+    create_app().run(debug=True, port=5000)
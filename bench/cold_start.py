@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import time
+
+# ==========================
+#   Benchmark de arranque en frío
+# ==========================
+#
+# Mide cuánto tarda un proceso nuevo de la aplicación web en estar listo:
+# importar app.py, create_app() y servir la primera petición. También mide lo
+# que cuesta cargar después la pila de Spotify (spotify_logic), que la
+# aplicación importa en la primera importación enviada y no al arrancar.
+# Uso:
+#   python bench/cold_start.py --runs 20 --output arranque.json
+#   python bench/cold_start.py --baseline arranque.json   # falla si hay regresiones
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from run_bench import percentile
+
+# Código que ejecuta cada proceso medido; imprime la duración de cada fase (ms)
+_CHILD = """
+import sys, json, time
+started = time.perf_counter()
+marks = {}
+import app
+marks["import_app"] = time.perf_counter()
+application = app.create_app(load_env=False)
+marks["create_app"] = time.perf_counter()
+client = application.test_client()
+assert client.get("/").status_code == 200
+client.get("/jobs/cold-start")
+marks["first_request"] = time.perf_counter()
+import spotify_logic
+marks["spotify_stack"] = time.perf_counter()
+previous, phases = started, {}
+for name, mark in marks.items():
+    phases[name] = (mark - previous) * 1000
+    previous = mark
+phases["ready"] = (marks["first_request"] - started) * 1000
+print(json.dumps(phases))
+"""
+
+# Fases en el orden en que se muestran
+PHASES = ("import_app", "create_app", "first_request", "ready", "spotify_stack", "process")
+
+
+def measure_once(workdir: str) -> dict:
+    """Arranca un intérprete nuevo y retorna la duración (ms) de cada fase."""
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": REPO_ROOT,
+        "FLASK_SECRET_KEY": "cold-start",
+        "JOBS_DB_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "SPOTIFY_SEARCH_CACHE_PATH": "",
+        "PLAYLIST_INDEX_PATH": "",
+        "SPOTIFY_CATALOG_PATH": "",
+        "CHECKPOINTS_DB_PATH": os.path.join(workdir, "checkpoints.sqlite3"),
+    })
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", _CHILD], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    phases = json.loads(output.strip().splitlines()[-1])
+    # Proceso completo: arranque del intérprete, fases medidas y salida
+    phases["process"] = (time.perf_counter() - started) * 1000
+    return phases
+
+
+def summarize(samples: list) -> dict:
+    """Retorna {fase: {p50, p90}} a partir de las muestras de cada ejecución."""
+    return {phase: {"p50": round(percentile([s[phase] for s in samples], 0.5), 2),
+                    "p90": round(percentile([s[phase] for s in samples], 0.9), 2)}
+            for phase in PHASES}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de arranque en frío de la aplicación web.")
+    parser.add_argument("--runs", type=int, default=10, help="Procesos que se arrancan (se informa la mediana y el p90).")
+    parser.add_argument("--output", help="Guarda los resultados en este fichero JSON.")
+    parser.add_argument("--baseline", help="Informe JSON anterior con el que comparar.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento relativo tolerado (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="spotify-cold-start-")
+    # Una ejecución descartada para calentar la caché de bytecode y del sistema de ficheros
+    measure_once(workdir)
+    samples = [measure_once(workdir) for _ in range(max(1, args.runs))]
+    summary = summarize(samples)
+
+    print(f"{'fase':<15} {'p50 ms':>9} {'p90 ms':>9}")
+    print("-" * 35)
+    for phase in PHASES:
+        print(f"{phase:<15} {summary[phase]['p50']:>9.2f} {summary[phase]['p90']:>9.2f}")
+
+    report = {"runs": len(samples), "python": sys.version.split()[0], "phases": summary}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = []
+        for phase in ("ready", "process"):
+            old, new = baseline.get("phases", {}).get(phase, {}).get("p50"), summary[phase]["p50"]
+            if old and new > old * (1 + args.tolerance):
+                regressions.append(f"{phase}: p50 {old} -> {new} ms")
+        if regressions:
+            print("\nRegresiones respecto a la línea base:")
+            for regression in regressions:
+                print(" -", regression)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
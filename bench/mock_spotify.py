@@ -0,0 +1,394 @@
+import re
+import json
+import time
+import zlib
+import random
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# ==========================
+#   Servidor local que imita la API de Spotify
+# ==========================
+#
+# Implementa solo los endpoints que usa spotify_logic:
+#   GET  /v1/me
+#   GET  /v1/search                  (type=track y type=album)
+#   GET  /v1/albums/<id>/tracks
+#   POST /v1/users/<user>/playlists
+#   GET  /v1/playlists/<id>
+#   GET  /v1/playlists/<id>/items
+#   POST /v1/playlists/<id>/items
+#   PUT  /v1/playlists/<id>/items    (solo reordenar)
+#   DELETE /v1/playlists/<id>/items
+# y dos endpoints de control para el benchmark:
+#   GET  /_stats   (llamadas por endpoint)
+#   POST /_reset   (pone a cero contadores y playlists)
+#
+# Los resultados son deterministas: que una búsqueda encuentre o no un track
+# depende solo del texto buscado y de miss_rate, nunca del orden de llegada.
+
+_BASE62 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+_FIELD_RE = re.compile(r'(\w+):(?:"([^"]*)"|(\S+))')
+
+
+def spotify_id(seed: str) -> str:
+    """ID base62 de 22 caracteres derivado de seed (mismo seed, mismo ID)."""
+    number = int.from_bytes(hashlib.sha1(seed.encode("utf-8")).digest(), "big")
+    chars = []
+    for _ in range(22):
+        number, rest = divmod(number, 62)
+        chars.append(_BASE62[rest])
+    return "".join(chars)
+
+
+def parse_query(query: str) -> dict:
+    """Separa una consulta 'track:"X" artist:"Y" isrc:Z' en {campo: valor}."""
+    return {name.lower(): (quoted if quoted is not None else bare)
+            for name, quoted, bare in _FIELD_RE.findall(query)}
+
+
+class MockState:
+    """Configuración y estado compartido por todas las peticiones del servidor."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 1.0, miss_rate: float = 0.1, strict_miss_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.miss_rate = miss_rate
+        self.strict_miss_rate = strict_miss_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.calls = {}
+            self.rate_limited = 0
+            self.playlists = {}
+
+    def count(self, endpoint: str) -> None:
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def should_rate_limit(self) -> bool:
+        with self.lock:
+            limited = self.rate_limit_rate > 0 and self.random.random() < self.rate_limit_rate
+            if limited:
+                self.rate_limited += 1
+            return limited
+
+    def delay(self) -> float:
+        with self.lock:
+            extra = self.random.uniform(0, self.jitter) if self.jitter else 0.0
+        return self.latency + extra
+
+    def is_miss(self, key: str, rate: float = None) -> bool:
+        """Decide de forma determinista si el catálogo no contiene `key`."""
+        bucket = zlib.crc32(key.lower().encode("utf-8")) % 10000
+        return bucket < (self.miss_rate if rate is None else rate) * 10000
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "calls": dict(self.calls),
+                "total_calls": sum(self.calls.values()),
+                "rate_limited": self.rate_limited,
+            }
+
+
+def _track_object(name: str, artist: str, album: str = None) -> dict:
+    track_id = spotify_id(f"track|{name.lower()}|{(artist or '').lower()}")
+    return {
+        "id": track_id,
+        "uri": f"spotify:track:{track_id}",
+        "name": name,
+        "artists": [{"name": artist or "Unknown Artist"}],
+        "album": {"name": album or f"{name} (Single)"},
+        "type": "track",
+    }
+
+
+class MockSpotifyHandler(BaseHTTPRequestHandler):
+    server_version = "MockSpotify/1.0"
+    protocol_version = "HTTP/1.1"
+    # Cabeceras y cuerpo se escriben por separado: sin esto Nagle añade ~40 ms por respuesta
+    disable_nagle_algorithm = True
+
+    @property
+    def state(self) -> MockState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        # Silencioso: el benchmark hace miles de peticiones
+        pass
+
+    # ---- Utilidades de respuesta ----
+
+    def _send_json(self, status: int, payload, headers: dict = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str) -> None:
+        self._send_json(status, {"error": {"status": status, "message": message}})
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        return json.loads(raw) if raw else {}
+
+    def _dispatch(self, method: str) -> None:
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        # El cuerpo se lee siempre para no romper la conexión keep-alive
+        body = self._read_json() if method in ("POST", "PUT", "DELETE") else None
+
+        if path == "/_stats" and method == "GET":
+            return self._send_json(200, self.state.stats())
+        if path == "/_reset" and method == "POST":
+            self.state.reset()
+            return self._send_json(200, {"ok": True})
+
+        routes = [
+            ("GET", r"/v1/me", self._me),
+            ("GET", r"/v1/search", self._search),
+            ("GET", r"/v1/albums/(?P<album_id>[^/]+)/tracks", self._album_tracks),
+            ("POST", r"/v1/users/(?P<user_id>[^/]+)/playlists", self._create_playlist),
+            ("GET", r"/v1/playlists/(?P<playlist_id>[^/]+)", self._get_playlist),
+            ("GET", r"/v1/playlists/(?P<playlist_id>[^/]+)/(?:items|tracks)", self._get_items),
+            ("POST", r"/v1/playlists/(?P<playlist_id>[^/]+)/(?:items|tracks)", self._add_items),
+            ("PUT", r"/v1/playlists/(?P<playlist_id>[^/]+)/(?:items|tracks)", self._reorder_items),
+            ("DELETE", r"/v1/playlists/(?P<playlist_id>[^/]+)/(?:items|tracks)", self._remove_items),
+        ]
+        for route_method, pattern, handler in routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                self.state.count(f"{method} {handler.__name__.lstrip('_')}")
+                delay = self.state.delay()
+                if delay:
+                    time.sleep(delay)
+                if self.state.should_rate_limit():
+                    return self._send_json(
+                        429, {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                        headers={"Retry-After": str(self.state.retry_after)},
+                    )
+                return handler(params, body, **match.groupdict())
+        self._error(404, f"Endpoint no implementado: {method} {path}")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    # ---- Endpoints ----
+
+    def _me(self, params, body):
+        self._send_json(200, {"id": "bench-user", "display_name": "Bench User", "type": "user"})
+
+    def _search(self, params, body):
+        query = params.get("q", "")
+        search_type = params.get("type", "track")
+        limit = max(1, min(50, int(params.get("limit", 10))))
+        fields = parse_query(query)
+
+        if search_type == "album":
+            upc = fields.get("upc")
+            items = []
+            if upc and not self.state.is_miss(f"upc|{upc}"):
+                items = [{"id": spotify_id(f"album|{upc}"), "name": f"Album {upc}", "type": "album"}]
+            return self._send_json(200, {"albums": {"items": items[:limit], "total": len(items), "next": None}})
+
+        items = []
+        if "isrc" in fields:
+            isrc = fields["isrc"]
+            if not self.state.is_miss(f"isrc|{isrc}"):
+                items = [_track_object(f"ISRC {isrc}", "ISRC Artist")]
+        else:
+            name = fields.get("track") or query.strip()
+            artist = fields.get("artist")
+            # Las consultas con álbum o año fallan a veces aunque el track exista
+            # (p. ej. un álbum mal escrito en la lista): strict_miss_rate
+            strict = "album" in fields or "year" in fields
+            if strict and self.state.is_miss(f"strict|{query}", self.state.strict_miss_rate):
+                name = None
+            if name and not self.state.is_miss(f"track|{name}"):
+                # Primer candidato: la coincidencia; el resto, versiones parecidas
+                items = [_track_object(name, artist, fields.get("album"))]
+                items += [_track_object(f"{name} (Version {n})", artist) for n in range(1, limit)]
+        self._send_json(200, {"tracks": {"items": items[:limit], "total": len(items), "next": None}})
+
+    def _album_tracks(self, params, body, album_id):
+        items = [_track_object(f"Track {n}", "Album Artist") for n in range(1, 11)]
+        self._send_json(200, {"items": items, "total": len(items), "next": None})
+
+    def _create_playlist(self, params, body, user_id):
+        with self.state.lock:
+            playlist_id = spotify_id(f"playlist|{len(self.state.playlists)}|{time.time()}")
+            self.state.playlists[playlist_id] = {"uris": [], "version": 0}
+        self._send_json(201, self._playlist_object(playlist_id, (body or {}).get("name")))
+
+    def _playlist_object(self, playlist_id: str, name: str = None) -> dict:
+        playlist = self.state.playlists[playlist_id]
+        return {
+            "id": playlist_id,
+            "name": name or playlist_id,
+            "external_urls": {"spotify": f"https://open.spotify.com/playlist/{playlist_id}"},
+            "snapshot_id": f"{playlist_id}-{playlist['version']}",
+            "tracks": {"total": len(playlist["uris"])},
+        }
+
+    def _get_playlist(self, params, body, playlist_id):
+        with self.state.lock:
+            if playlist_id not in self.state.playlists:
+                return self._error(404, "Not found.")
+            payload = self._playlist_object(playlist_id)
+        self._send_json(200, payload)
+
+    def _get_items(self, params, body, playlist_id):
+        offset = int(params.get("offset", 0))
+        limit = max(1, min(100, int(params.get("limit", 100))))
+        with self.state.lock:
+            playlist = self.state.playlists.get(playlist_id)
+            if playlist is None:
+                return self._error(404, "Not found.")
+            uris = playlist["uris"][offset:offset + limit]
+            total = len(playlist["uris"])
+        items = [{"track": {"uri": uri}} for uri in uris]
+        self._send_json(200, {"items": items, "total": total, "offset": offset, "limit": limit, "next": None})
+
+    def _add_items(self, params, body, playlist_id):
+        # spotipy envía la lista de URIs como cuerpo y la posición como parámetro
+        uris = body if isinstance(body, list) else (body.get("uris") or [])
+        position = params.get("position", body.get("position") if isinstance(body, dict) else None)
+        if len(uris) > 100:
+            return self._error(400, "You can add a maximum of 100 tracks per request.")
+        with self.state.lock:
+            playlist = self.state.playlists.get(playlist_id)
+            if playlist is None:
+                return self._error(404, "Not found.")
+            if position is None:
+                playlist["uris"].extend(uris)
+            else:
+                position = int(position)
+                playlist["uris"][position:position] = uris
+            playlist["version"] += 1
+            snapshot_id = f"{playlist_id}-{playlist['version']}"
+        self._send_json(201, {"snapshot_id": snapshot_id})
+
+    def _check_snapshot(self, playlist_id: str, playlist: dict, body: dict) -> bool:
+        """
+        Comprueba el snapshot_id de una escritura. A diferencia de Spotify, el mock
+        no combina versiones: uno obsoleto responde 400 (así se detectan escrituras
+        que no encadenan el snapshot de la respuesta anterior).
+        """
+        snapshot_id = (body or {}).get("snapshot_id")
+        if snapshot_id and snapshot_id != f"{playlist_id}-{playlist['version']}":
+            self._error(400, "Invalid snapshot_id (el mock no combina versiones).")
+            return False
+        return True
+
+    def _reorder_items(self, params, body, playlist_id):
+        body = body or {}
+        if "range_start" not in body or "insert_before" not in body:
+            return self._error(400, "Replacing items is not supported by the mock.")
+        start, before = int(body["range_start"]), int(body["insert_before"])
+        length = int(body.get("range_length", 1))
+        with self.state.lock:
+            playlist = self.state.playlists.get(playlist_id)
+            if playlist is None:
+                return self._error(404, "Not found.")
+            if not self._check_snapshot(playlist_id, playlist, body):
+                return
+            uris = playlist["uris"]
+            if start < 0 or length < 1 or start + length > len(uris) or not 0 <= before <= len(uris):
+                return self._error(400, "Invalid range.")
+            block = uris[start:start + length]
+            del uris[start:start + length]
+            at = before if before < start else max(start, before - length)
+            uris[at:at] = block
+            playlist["version"] += 1
+            snapshot_id = f"{playlist_id}-{playlist['version']}"
+        self._send_json(200, {"snapshot_id": snapshot_id})
+
+    def _remove_items(self, params, body, playlist_id):
+        items = (body or {}).get("items") or (body or {}).get("tracks") or []
+        if len(items) > 100:
+            return self._error(400, "You can remove a maximum of 100 tracks per request.")
+        with self.state.lock:
+            playlist = self.state.playlists.get(playlist_id)
+            if playlist is None:
+                return self._error(404, "Not found.")
+            if not self._check_snapshot(playlist_id, playlist, body):
+                return
+            removed = {item["uri"] for item in items}
+            playlist["uris"] = [uri for uri in playlist["uris"] if uri not in removed]
+            playlist["version"] += 1
+            snapshot_id = f"{playlist_id}-{playlist['version']}"
+        self._send_json(200, {"snapshot_id": snapshot_id})
+
+
+def create_server(host: str = "127.0.0.1", port: int = 0, **options) -> ThreadingHTTPServer:
+    """Crea el servidor (port=0 elige un puerto libre). options se pasan a MockState."""
+    server = ThreadingHTTPServer((host, port), MockSpotifyHandler)
+    server.daemon_threads = True
+    server.state = MockState(**options)
+    return server
+
+
+def serve_in_process(ready, options: dict) -> None:
+    """
+    Punto de entrada para multiprocessing: arranca el servidor y envía su
+    puerto por `ready` (una Queue). Correr en otro proceso evita que el
+    servidor compita por el GIL con el código que se está midiendo.
+    """
+    server = create_server(**options)
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de Spotify.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latencia fija por petición (segundos).")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latencia aleatoria adicional máxima (segundos).")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fracción de peticiones que responden 429.")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Valor de Retry-After en las respuestas 429.")
+    parser.add_argument("--miss-rate", type=float, default=0.1, help="Fracción de búsquedas sin resultado.")
+    parser.add_argument("--strict-miss-rate", type=float, default=0.0,
+                        help="Fracción de búsquedas con álbum o año que no devuelven nada aunque el track exista.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = create_server(
+        args.host, args.port, latency=args.latency, jitter=args.jitter, rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after, miss_rate=args.miss_rate, strict_miss_rate=args.strict_miss_rate,
+        seed=args.seed,
+    )
+    print(f"Mock de Spotify escuchando en http://{args.host}:{server.server_address[1]}/v1/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+import multiprocessing
+import urllib.request
+
+# ==========================
+#   Benchmark de resolución e importación
+# ==========================
+#
+# Mide process_tracks (ruta de librería), main.create_spotify_playlist_from_file
+# (ruta CLI) y resolve_tracks (ruta resolve, sin playlist) contra
+# bench/mock_spotify.py, sin tocar la API real.
+# Uso:
+#   python bench/run_bench.py --sizes 10,100,1000 --output resultados.json
+#   python bench/run_bench.py --baseline resultados.json   # falla si hay regresiones
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+
+_WORDS = ("love", "night", "blue", "fire", "dream", "heart", "city", "rain", "gold", "echo",
+          "river", "light", "shadow", "summer", "ghost", "wild", "silver", "ocean", "storm", "road")
+
+
+# ==========================
+#   Generadores de listas de tracks
+# ==========================
+
+def generate_tracks(count: int, seed: int = 0, duplicate_ratio: float = 0.05, isrc_ratio: float = 0.3) -> list:
+    """
+    Genera `count` tracks sintéticos con el formato de tracks.json.
+    duplicate_ratio es la fracción de entradas que repiten un track anterior;
+    isrc_ratio la fracción de tracks que incluyen ISRC.
+    """
+    rng = random.Random(seed)
+    tracks = []
+    for index in range(count):
+        if tracks and rng.random() < duplicate_ratio:
+            tracks.append(dict(rng.choice(tracks)))
+            continue
+        title = " ".join(rng.choice(_WORDS).capitalize() for _ in range(rng.randint(1, 3)))
+        track = {
+            "track": f"{title} {index}",
+            "artist": f"{rng.choice(_WORDS).capitalize()} {rng.choice(('Band', 'Project', 'Trio', 'Collective'))}",
+            "album": f"{rng.choice(_WORDS).capitalize()} Sessions",
+            "year": rng.randint(1960, 2024),
+        }
+        if rng.random() < isrc_ratio:
+            track["isrc"] = f"US{rng.choice(('ABC', 'XYZ', 'QRS'))}{rng.randint(10, 99)}{index:05d}"
+        tracks.append(track)
+    return tracks
+
+
+# ==========================
+#   Entorno aislado
+# ==========================
+
+def start_mock_server(options: dict):
+    """Arranca el mock en un proceso aparte y retorna (proceso, URL base)."""
+    sys.path.insert(0, BENCH_DIR)
+    import mock_spotify
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    process = context.Process(target=mock_spotify.serve_in_process, args=(ready, options), daemon=True)
+    process.start()
+    port = ready.get(timeout=30)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def prepare_environment(base_url: str, args) -> str:
+    """
+    Configura las variables de entorno antes de importar el código del repositorio
+    (los módulos leen su configuración al importarse) y crea un directorio de trabajo
+    temporal con un token OAuth válido en .cache (y el mismo como token de la
+    aplicación, para la ruta resolve). Retorna ese directorio.
+    """
+    workdir = tempfile.mkdtemp(prefix="spotify-bench-")
+    os.environ.update({
+        "SPOTIFY_API_PREFIX": f"{base_url}/v1/",
+        "SPOTIFY_CLIENT_ID": "bench-client",
+        "SPOTIFY_CLIENT_SECRET": "bench-secret",
+        "SPOTIFY_REDIRECT_URI": "http://localhost:5000/callback",
+        "SPOTIFY_REQUESTS_PER_SECOND": str(args.rps),
+        "SPOTIFY_BURST_SIZE": str(max(1, int(args.rps))),
+        "SPOTIFY_SEARCH_CACHE_PATH": os.path.join(workdir, "search_cache.sqlite3") if args.search_cache else "",
+        "PLAYLIST_INDEX_PATH": "",
+        "SPOTIFY_CATALOG_PATH": os.path.join(workdir, "catalog.sqlite3") if args.catalog else "",
+        "CHECKPOINTS_DB_PATH": os.path.join(workdir, "checkpoints.sqlite3"),
+    })
+    if args.max_concurrent:
+        os.environ["SPOTIFY_MAX_CONCURRENT_REQUESTS"] = str(args.max_concurrent)
+    if args.workers:
+        os.environ["SPOTIFY_MAX_WORKERS"] = str(args.workers)
+
+    token = {
+        "access_token": "bench-token",
+        "token_type": "Bearer",
+        "expires_in": 3600,
+        "expires_at": int(time.time()) + 10 * 365 * 24 * 3600,
+        "refresh_token": "bench-refresh",
+        "scope": "playlist-modify-public playlist-modify-private",
+    }
+    for name in (".cache", ".cache-app-bench-client"):
+        with open(os.path.join(workdir, name), "w") as f:
+            json.dump(token, f)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    # spotipy registra cada 429 como error; el benchmark ya los cuenta en el servidor
+    logging.getLogger("spotipy").setLevel(logging.CRITICAL)
+    return workdir
+
+
+def _server_request(base_url: str, path: str, method: str = "GET") -> dict:
+    request = urllib.request.Request(base_url + path, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+
+# ==========================
+#   Ejecución de escenarios
+# ==========================
+
+class LatencyRecorder:
+    """Envuelve spotify_logic.resolve_track y guarda la duración de cada llamada."""
+
+    def __init__(self, spotify_logic):
+        self.module = spotify_logic
+        self.original = spotify_logic.resolve_track
+        self.samples = []
+
+    def __enter__(self):
+        original, samples = self.original, self.samples
+
+        def timed_resolve_track(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+
+        self.module.resolve_track = timed_resolve_track
+        return self
+
+    def __exit__(self, *exc):
+        self.module.resolve_track = self.original
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """Percentil por rango más cercano (0 si no hay muestras)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def run_library(tracks: list, workdir: str) -> None:
+    from spotify_logic import process_tracks
+    result = process_tracks(
+        client_id=os.environ["SPOTIFY_CLIENT_ID"],
+        client_secret=os.environ["SPOTIFY_CLIENT_SECRET"],
+        redirect_uri=os.environ["SPOTIFY_REDIRECT_URI"],
+        tracks_data=tracks,
+        playlist_name="Bench",
+    )
+    if "error" in result:
+        raise RuntimeError(result["error"])
+
+
+def run_cli(tracks: list, workdir: str) -> None:
+    import main
+    main.create_spotify_playlist_from_file(os.path.join(workdir, "tracks.json"))
+
+
+def run_resolve(tracks: list, workdir: str) -> None:
+    from spotify_logic import resolve_tracks
+    result = resolve_tracks(
+        client_id=os.environ["SPOTIFY_CLIENT_ID"],
+        client_secret=os.environ["SPOTIFY_CLIENT_SECRET"],
+        tracks_data=tracks,
+    )
+    if "error" in result:
+        raise RuntimeError(result["error"])
+
+
+PATHS = {"library": run_library, "cli": run_cli, "resolve": run_resolve}
+
+
+def run_scenario(path: str, tracks: list, base_url: str, workdir: str, measure_memory: bool) -> dict:
+    """Ejecuta un escenario y retorna sus métricas."""
+    import spotify_logic
+    runner = PATHS[path]
+    if path == "cli":
+        # El fichero se escribe fuera de la medición
+        with open(os.path.join(workdir, "tracks.json"), "w") as f:
+            json.dump(tracks, f)
+
+    _server_request(base_url, "/_reset", "POST")
+    with LatencyRecorder(spotify_logic) as recorder, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        runner(tracks, workdir)
+        elapsed = time.perf_counter() - start
+    stats = _server_request(base_url, "/_stats")
+
+    peak_memory = None
+    if measure_memory:
+        # Pasada aparte: tracemalloc ralentiza el código y falsearía el tiempo
+        _server_request(base_url, "/_reset", "POST")
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                runner(tracks, workdir)
+            peak_memory = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+
+    count = len(tracks)
+    return {
+        "path": path,
+        "size": count,
+        "seconds": round(elapsed, 4),
+        "tracks_per_second": round(count / elapsed, 2) if elapsed else None,
+        "api_calls": stats["total_calls"],
+        "api_calls_per_track": round(stats["total_calls"] / count, 4) if count else None,
+        "calls_by_endpoint": stats["calls"],
+        "rate_limited": stats["rate_limited"],
+        "p50_ms": round(percentile(recorder.samples, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(recorder.samples, 0.99) * 1000, 3),
+        "peak_memory_mb": round(peak_memory, 3) if peak_memory is not None else None,
+    }
+
+
+# ==========================
+#   Informe y comparación
+# ==========================
+
+# (métrica, True si un valor mayor es peor)
+_COMPARED_METRICS = (
+    ("tracks_per_second", False),
+    ("api_calls_per_track", True),
+    ("p99_ms", True),
+    ("peak_memory_mb", True),
+)
+
+
+def print_table(results: list) -> None:
+    header = f"{'ruta':<8} {'tracks':>7} {'seg':>8} {'tracks/s':>9} {'llamadas/track':>15} " \
+             f"{'p50 ms':>8} {'p99 ms':>8} {'429':>5} {'mem MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        memory = f"{r['peak_memory_mb']:.2f}" if r["peak_memory_mb"] is not None else "-"
+        print(f"{r['path']:<8} {r['size']:>7} {r['seconds']:>8.2f} {r['tracks_per_second']:>9.1f} "
+              f"{r['api_calls_per_track']:>15.3f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{r['rate_limited']:>5} {memory:>8}")
+
+
+def compare_with_baseline(results: list, baseline: dict, tolerance: float) -> list:
+    """Retorna la lista de regresiones (texto) respecto a un informe anterior."""
+    previous = {(r["path"], r["size"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        base = previous.get((r["path"], r["size"]))
+        if base is None:
+            continue
+        for metric, higher_is_worse in _COMPARED_METRICS:
+            new, old = r.get(metric), base.get(metric)
+            if new is None or not old:
+                continue
+            worse = new > old * (1 + tolerance) if higher_is_worse else new < old * (1 - tolerance)
+            if worse:
+                regressions.append(f"{r['path']}/{r['size']}: {metric} {old} -> {new}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de playlist-spotify contra un mock local de la API.")
+    parser.add_argument("--sizes", default="10,100,1000", help="Tamaños de lista separados por comas (hasta 100000).")
+    parser.add_argument("--paths", default="library,cli", help="Rutas a medir: library, cli, resolve (sin playlist).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latencia por petición del mock (segundos).")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latencia aleatoria adicional del mock (segundos).")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fracción de peticiones que responden 429.")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After de las respuestas 429 (segundos).")
+    parser.add_argument("--miss-rate", type=float, default=0.1, help="Fracción de tracks que no existen en el catálogo.")
+    parser.add_argument("--strict-miss-rate", type=float, default=0.3,
+                        help="Fracción de búsquedas con álbum o año que fallan aunque el track exista.")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.05)
+    parser.add_argument("--isrc-ratio", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rps", type=float, default=100000,
+                        help="SPOTIFY_REQUESTS_PER_SECOND durante el benchmark (alto para medir el código, no el límite).")
+    parser.add_argument("--max-concurrent", type=int, help="SPOTIFY_MAX_CONCURRENT_REQUESTS durante el benchmark.")
+    parser.add_argument("--workers", type=int, help="SPOTIFY_MAX_WORKERS durante el benchmark.")
+    parser.add_argument("--search-cache", action="store_true",
+                        help="Activa la caché de búsquedas (compartida por todos los escenarios de la ejecución).")
+    parser.add_argument("--catalog", action="store_true",
+                        help="Activa el catálogo local (vacío al empezar; aprende de las resoluciones de cada escenario).")
+    parser.add_argument("--skip-memory", action="store_true", help="No mide la memoria (evita la pasada con tracemalloc).")
+    parser.add_argument("--output", help="Guarda los resultados en este fichero JSON.")
+    parser.add_argument("--baseline", help="Informe JSON anterior con el que comparar.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento relativo tolerado (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    paths = [path.strip() for path in args.paths.split(",") if path.strip()]
+    unknown = [path for path in paths if path not in PATHS]
+    if unknown:
+        parser.error(f"Rutas desconocidas: {', '.join(unknown)}")
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    server, base_url = start_mock_server({
+        "latency": args.latency, "jitter": args.jitter, "rate_limit_rate": args.rate_limit_rate,
+        "retry_after": args.retry_after, "miss_rate": args.miss_rate,
+        "strict_miss_rate": args.strict_miss_rate, "seed": args.seed,
+    })
+    try:
+        workdir = prepare_environment(base_url, args)
+        results = []
+        for size in sizes:
+            tracks = generate_tracks(size, args.seed, args.duplicate_ratio, args.isrc_ratio)
+            for path in paths:
+                print(f"Midiendo {path} con {size} tracks...", file=sys.stderr)
+                results.append(run_scenario(path, tracks, base_url, workdir, not args.skip_memory))
+    finally:
+        server.terminate()
+
+    print_table(results)
+    report = {"config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}, "results": results}
+    if output_path:
+        with open(output_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResultados guardados en {output_path}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegresiones respecto a {baseline_path} (tolerancia {args.tolerance:.0%}):")
+            for line in regressions:
+                print(" -", line)
+            return 1
+        print(f"\nSin regresiones respecto a {baseline_path}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
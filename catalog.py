@@ -0,0 +1,271 @@
+import os
+import io
+import csv
+import time
+import sqlite3
+import argparse
+import threading
+from matching import normalize_text
+from metrics import get_metrics
+from track_ingest import iter_json_objects
+
+# ==========================
+#   Configuración del catálogo
+# ==========================
+
+# Fichero SQLite con el catálogo local de tracks ya resueltos. Vacío lo desactiva.
+CATALOG_PATH = os.getenv("SPOTIFY_CATALOG_PATH", "catalog.sqlite3")
+# Bytes del fichero que SQLite lee mediante mmap: las consultas leen las páginas
+# directamente del fichero mapeado y abrir el catálogo no carga nada en memoria.
+CATALOG_MMAP_SIZE = int(os.getenv("SPOTIFY_CATALOG_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Confianza mínima de una resolución por búsqueda para incorporarla al catálogo
+CATALOG_LEARN_MIN_CONFIDENCE = float(os.getenv("SPOTIFY_CATALOG_LEARN_MIN_CONFIDENCE", "0.9"))
+
+# Resoluciones aprendidas que se acumulan antes de escribirlas en bloque
+_FLUSH_EVERY = 200
+# Filas por transacción al cargar una exportación
+_LOAD_BATCH = 5000
+
+# Nombres de columna aceptados en las exportaciones CSV (en minúsculas), por campo
+_CSV_COLUMNS = {
+    "uri": ("uri", "track uri", "spotify_uri", "spotify uri"),
+    "track": ("track", "track name", "name", "title"),
+    "artist": ("artist", "artist name(s)", "artists", "artist name"),
+    "isrc": ("isrc",),
+}
+
+
+def _isrc_key(value) -> str:
+    return "".join(ch for ch in str(value or "") if ch.isalnum()).upper()
+
+
+class CatalogIndex:
+    """
+    Catálogo local (SQLite) de tracks ya resueltos, para resolverlos sin
+    llamar a la API. Se indexa por ISRC y por (título, artista) normalizados
+    (ver matching.normalize_text), cada uno en una tabla con clave primaria
+    sin rowid, de modo que cada consulta es una única búsqueda en un B-tree.
+    Se rellena cargando una exportación (load) y con las resoluciones de las
+    importaciones que superan CATALOG_LEARN_MIN_CONFIDENCE (learn). Ambos
+    reemplazan las entradas existentes, así que se puede actualizar en cualquier
+    momento, también con otros procesos leyendo.
+    """
+
+    def __init__(self, path: str = CATALOG_PATH, mmap_size: int = CATALOG_MMAP_SIZE):
+        self.path = path
+        self._pending = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS catalog_isrc (
+                   isrc TEXT PRIMARY KEY,
+                   uri TEXT NOT NULL,
+                   updated_at REAL NOT NULL
+               ) WITHOUT ROWID"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS catalog_titles (
+                   title TEXT NOT NULL,
+                   artist TEXT NOT NULL,
+                   uri TEXT NOT NULL,
+                   confidence REAL NOT NULL,
+                   updated_at REAL NOT NULL,
+                   PRIMARY KEY (title, artist)
+               ) WITHOUT ROWID"""
+        )
+
+    def lookup(self, track_info: dict) -> tuple:
+        """
+        Busca el track por ISRC o, si no tiene identificador (ISRC ni UPC), por
+        (título, artista). Un track con ISRC que no está en el catálogo, o con
+        UPC, no se busca por título: la búsqueda exacta por identificador en
+        Spotify debe ir antes que una coincidencia aprendida que podría ser otra
+        grabación.
+        Retorna (uri, confianza) o (None, 0.0) si el catálogo no lo conoce.
+        """
+        isrc = _isrc_key(track_info.get("isrc"))
+        title, artist = normalize_text(track_info.get("track")), normalize_text(track_info.get("artist"))
+        row = None
+        try:
+            with self._lock:
+                if isrc:
+                    row = self._conn.execute("SELECT uri, 1.0 FROM catalog_isrc WHERE isrc = ?", (isrc,)).fetchone()
+                elif title and artist and not track_info.get("upc"):
+                    row = self._conn.execute(
+                        "SELECT uri, confidence FROM catalog_titles WHERE title = ? AND artist = ?", (title, artist)
+                    ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error leyendo el catálogo: {e}")
+        get_metrics().inc("cache_requests_total", cache="catalog", result="hit" if row else "miss")
+        return (row[0], row[1]) if row else (None, 0.0)
+
+    def learn(self, track_info: dict, uri: str, confidence: float, by_isrc: bool = False) -> None:
+        """
+        Incorpora una resolución al catálogo si su confianza llega a
+        CATALOG_LEARN_MIN_CONFIDENCE. by_isrc indica que Spotify encontró el
+        track por su ISRC (solo entonces se guarda la clave ISRC).
+        Las escrituras se acumulan y se hacen en bloque (ver flush).
+        """
+        if not uri or confidence < CATALOG_LEARN_MIN_CONFIDENCE:
+            return
+        isrc = _isrc_key(track_info.get("isrc")) if by_isrc else ""
+        title, artist = normalize_text(track_info.get("track")), normalize_text(track_info.get("artist"))
+        with self._lock:
+            if isrc:
+                self._pending.append((isrc, None, None, uri, 1.0))
+            if title and artist:
+                self._pending.append((None, title, artist, uri, confidence))
+            if len(self._pending) >= _FLUSH_EVERY:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        """Escribe las resoluciones aprendidas pendientes."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        rows, self._pending = self._pending, []
+        if rows:
+            try:
+                self._write(rows)
+            except sqlite3.Error as e:
+                print(f"Error escribiendo en el catálogo: {e}")
+
+    def _write(self, rows: list) -> None:
+        """Guarda filas (isrc, título, artista, uri, confianza) en una transacción. Requiere el lock."""
+        now = time.time()
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO catalog_isrc (isrc, uri, updated_at) VALUES (?, ?, ?)",
+                [(isrc, uri, now) for isrc, _, _, uri, _ in rows if isrc],
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO catalog_titles (title, artist, uri, confidence, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(title, artist, uri, confidence, now) for isrc, title, artist, uri, confidence in rows if title],
+            )
+        except sqlite3.Error:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def load(self, stream, csv_format: bool = False) -> int:
+        """
+        Carga una exportación de tracks ya resueltos y retorna cuántos se leyeron.
+        Acepta un array JSON o NDJSON de objetos con 'uri' y 'isrc' y/o
+        'track' + 'artist' ('artist' puede ser una lista), o un CSV con cabecera
+        (p. ej. el de Exportify: "Track URI", "Track Name", "Artist Name(s)", "ISRC").
+        Con varios artistas se indexa cada uno y también todos juntos.
+        """
+        entries = _iter_csv(stream) if csv_format else iter_json_objects(stream)
+        loaded, rows = 0, []
+        for entry in entries:
+            if not isinstance(entry, dict) or not entry.get("uri"):
+                continue
+            loaded += 1
+            uri = entry["uri"]
+            isrc = _isrc_key(entry.get("isrc"))
+            if isrc:
+                rows.append((isrc, None, None, uri, 1.0))
+            title = normalize_text(entry.get("track"))
+            if title:
+                for artist in _artist_keys(entry.get("artist")):
+                    rows.append((None, title, artist, uri, 1.0))
+            if len(rows) >= _LOAD_BATCH:
+                with self._lock:
+                    self._write(rows)
+                rows = []
+        if rows:
+            with self._lock:
+                self._write(rows)
+        return loaded
+
+    def stats(self) -> dict:
+        """Retorna el número de entradas por ISRC y por título."""
+        with self._lock:
+            (isrc,) = self._conn.execute("SELECT COUNT(*) FROM catalog_isrc").fetchone()
+            (titles,) = self._conn.execute("SELECT COUNT(*) FROM catalog_titles").fetchone()
+        return {"isrc": isrc, "titles": titles}
+
+
+def _artist_keys(artist) -> list:
+    """Claves de artista de una entrada exportada: cada artista y todos juntos."""
+    names = artist if isinstance(artist, list) else str(artist or "").split(",")
+    names = [normalize_text(name) for name in names]
+    keys = [name for name in names if name]
+    joined = " ".join(keys)
+    if joined and joined not in keys:
+        keys.append(joined)
+    return keys
+
+
+def _iter_csv(stream):
+    """Produce las filas de un CSV con cabecera como {uri, track, artist, isrc}."""
+    text = stream if isinstance(stream, io.TextIOBase) else io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    for row in csv.DictReader(text):
+        lowered = {(key or "").strip().lower(): value for key, value in row.items()}
+        yield {field: next((lowered[name] for name in names if lowered.get(name)), None)
+               for field, names in _CSV_COLUMNS.items()}
+
+
+# ==========================
+#   Instancia compartida
+# ==========================
+
+_shared_catalog = None
+_shared_catalog_failed = False
+_shared_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """
+    Retorna el catálogo compartido del proceso, abriéndolo la primera vez.
+    Retorna None si está desactivado (SPOTIFY_CATALOG_PATH vacío) o si no se
+    pudo abrir; en ese caso no se vuelve a intentar (se avisa una sola vez).
+    """
+    global _shared_catalog, _shared_catalog_failed
+    if not CATALOG_PATH or _shared_catalog_failed:
+        return None
+    if _shared_catalog is None:
+        with _shared_catalog_lock:
+            if _shared_catalog is None and not _shared_catalog_failed:
+                try:
+                    _shared_catalog = CatalogIndex(CATALOG_PATH)
+                except sqlite3.Error as e:
+                    _shared_catalog_failed = True
+                    print(f"No se pudo abrir el catálogo '{CATALOG_PATH}': {e}. Se continúa sin catálogo.")
+    return _shared_catalog
+
+
+# ==========================
+#   Línea de comandos
+# ==========================
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Gestiona el catálogo local de tracks ya resueltos.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    load = subcommands.add_parser("load", help="Carga una exportación (JSON, NDJSON o CSV).")
+    load.add_argument("paths", nargs="+", help="Archivos de exportación.")
+    subcommands.add_parser("stats", help="Muestra el número de entradas del catálogo.")
+    args = parser.parse_args(argv)
+
+    catalog = get_catalog()
+    if catalog is None:
+        print("El catálogo está desactivado (SPOTIFY_CATALOG_PATH vacío).")
+        return 2
+    if args.command == "load":
+        for path in args.paths:
+            with open(path, "rb") as f:
+                loaded = catalog.load(f, csv_format=path.lower().endswith(".csv"))
+            print(f"{path}: {loaded} tracks cargados.")
+    stats = catalog.stats()
+    print(f"Catálogo {catalog.path}: {stats['isrc']} ISRC, {stats['titles']} títulos.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
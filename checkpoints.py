@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# ==========================
+#   Configuración de checkpoints
+# ==========================
+
+# Fichero SQLite donde se guarda el avance de cada importación
+CHECKPOINTS_DB_PATH = os.getenv("CHECKPOINTS_DB_PATH", "checkpoints.sqlite3")
+# Tiempo que se conservan los checkpoints (segundos)
+CHECKPOINT_RETENTION = int(os.getenv("CHECKPOINT_RETENTION_SECONDS", str(7 * 24 * 3600)))
+# Las resoluciones se escriben en bloques de este tamaño
+_FLUSH_EVERY = 200
+
+
+class CheckpointMismatch(Exception):
+    """La entrada no coincide con la importación guardada en el checkpoint."""
+
+
+class CheckpointStore:
+    """
+    Almacén SQLite del avance de las importaciones: tracks ya resueltos,
+    el plan de escritura (playlist destino y URIs a añadir) y los lotes
+    ya añadidos. Permite reanudar una importación sin repetir búsquedas
+    ni añadir dos veces el mismo lote.
+    """
+
+    def __init__(self, path: str = CHECKPOINTS_DB_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Una fila por checkpoint con su fecha de creación: la caducidad se decide
+        # aquí y no en el plan, que no existe si la importación falló antes de crearlo.
+        legacy = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'checkpoint_tracks'"
+        ).fetchone() is not None and self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'checkpoints'"
+        ).fetchone() is None
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS checkpoints (
+                   checkpoint_id TEXT PRIMARY KEY,
+                   created_at REAL NOT NULL
+               )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS checkpoint_tracks (
+                   checkpoint_id TEXT NOT NULL,
+                   idx INTEGER NOT NULL,
+                   uri TEXT,
+                   track TEXT,
+                   artist TEXT,
+                   album TEXT,
+                   PRIMARY KEY (checkpoint_id, idx)
+               )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS checkpoint_plans (
+                   checkpoint_id TEXT PRIMARY KEY,
+                   playlist_id TEXT NOT NULL,
+                   playlist_url TEXT,
+                   uris TEXT NOT NULL,
+                   tracks_count INTEGER NOT NULL,
+                   created_at REAL NOT NULL,
+                   pipelined INTEGER NOT NULL DEFAULT 0,
+                   existing_uris TEXT
+               )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS checkpoint_batches (
+                   checkpoint_id TEXT NOT NULL,
+                   batch_index INTEGER NOT NULL,
+                   PRIMARY KEY (checkpoint_id, batch_index)
+               )"""
+        )
+        self._add_missing_columns("checkpoint_plans", {
+            "pipelined": "INTEGER NOT NULL DEFAULT 0",
+            "existing_uris": "TEXT",
+        })
+        if legacy:
+            self._register_legacy_checkpoints()
+        self.purge_expired()
+
+    def _register_legacy_checkpoints(self) -> None:
+        """
+        Da de alta en la tabla checkpoints los de una base de datos de una versión
+        anterior: con la fecha de su plan si lo tienen y, si no, con la actual.
+        """
+        now = time.time()
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO checkpoints (checkpoint_id, created_at) "
+                "SELECT checkpoint_id, created_at FROM checkpoint_plans"
+            )
+            for table in ("checkpoint_tracks", "checkpoint_batches"):
+                self.conn.execute(
+                    f"INSERT OR IGNORE INTO checkpoints (checkpoint_id, created_at) "
+                    f"SELECT DISTINCT checkpoint_id, ? FROM {table}",
+                    (now,),
+                )
+        except sqlite3.Error:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _add_missing_columns(self, table: str, columns: dict) -> None:
+        """Añade a una tabla existente las columnas que falten (bases de datos de versiones anteriores)."""
+        existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+        for name, column_type in columns.items():
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+    def open(self, checkpoint_id: str) -> "ImportCheckpoint":
+        """
+        Retorna el checkpoint con ese ID (vacío si es una importación nueva).
+        La primera vez que se abre queda registrado con la fecha actual.
+        """
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO checkpoints (checkpoint_id, created_at) VALUES (?, ?)",
+                (checkpoint_id, time.time()),
+            )
+        return ImportCheckpoint(self, checkpoint_id)
+
+    def purge_expired(self) -> None:
+        """
+        Elimina los checkpoints creados hace más de CHECKPOINT_RETENTION segundos,
+        tengan o no plan de escritura.
+        """
+        cutoff = time.time() - CHECKPOINT_RETENTION
+        with self.lock:
+            expired = [row[0] for row in self.conn.execute(
+                "SELECT checkpoint_id FROM checkpoints WHERE created_at < ?", (cutoff,)
+            )]
+            for table in ("checkpoint_tracks", "checkpoint_batches", "checkpoint_plans", "checkpoints"):
+                self.conn.executemany(f"DELETE FROM {table} WHERE checkpoint_id = ?", [(c,) for c in expired])
+
+
+class ImportCheckpoint:
+    """
+    Avance de una importación concreta.
+    Las resoluciones se acumulan y se escriben en bloque; flush() las persiste.
+    """
+
+    def __init__(self, store: CheckpointStore, checkpoint_id: str):
+        self.store = store
+        self.checkpoint_id = checkpoint_id
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def load_resolutions(self) -> dict:
+        """
+        Retorna las resoluciones guardadas: {índice: (uri, {track, artist, album})}.
+        uri es None para los tracks no encontrados.
+        """
+        with self.store.lock:
+            rows = self.store.conn.execute(
+                "SELECT idx, uri, track, artist, album FROM checkpoint_tracks WHERE checkpoint_id = ?",
+                (self.checkpoint_id,),
+            ).fetchall()
+        return {idx: (uri, {"track": track, "artist": artist, "album": album})
+                for idx, uri, track, artist, album in rows}
+
+    def record_resolution(self, index: int, uri: str, track_info: dict) -> None:
+        """Registra el resultado de la búsqueda del track en la posición index."""
+        with self._lock:
+            self._pending.append((
+                self.checkpoint_id, index, uri,
+                track_info.get("track", "N/A"), track_info.get("artist", "N/A"), track_info.get("album", "N/A"),
+            ))
+            if len(self._pending) >= _FLUSH_EVERY:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        """Persiste las resoluciones pendientes."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        rows, self._pending = self._pending, []
+        if not rows:
+            return
+        with self.store.lock:
+            self.store.conn.execute("BEGIN")
+            try:
+                self.store.conn.executemany(
+                    "INSERT OR REPLACE INTO checkpoint_tracks (checkpoint_id, idx, uri, track, artist, album) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            except sqlite3.Error:
+                self.store.conn.execute("ROLLBACK")
+                raise
+            self.store.conn.execute("COMMIT")
+
+    def load_plan(self) -> dict:
+        """
+        Retorna el plan de escritura guardado
+        {playlist_id, playlist_url, uris, tracks_count, pipelined, existing_uris},
+        o None si aún no existe.
+        """
+        with self.store.lock:
+            row = self.store.conn.execute(
+                "SELECT playlist_id, playlist_url, uris, tracks_count, pipelined, existing_uris "
+                "FROM checkpoint_plans WHERE checkpoint_id = ?",
+                (self.checkpoint_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        playlist_id, playlist_url, uris, tracks_count, pipelined, existing_uris = row
+        return {"playlist_id": playlist_id, "playlist_url": playlist_url,
+                "uris": json.loads(uris), "tracks_count": tracks_count, "pipelined": bool(pipelined),
+                "existing_uris": json.loads(existing_uris) if existing_uris else []}
+
+    def save_plan(self, playlist_id: str, playlist_url: str, uris: list, tracks_count: int,
+                  pipelined: bool = False, existing_uris: list = None) -> None:
+        """
+        Guarda la playlist destino y la lista definitiva de URIs a añadir.
+        En modo pipelined el plan se guarda antes de buscar: uris va vacío y
+        existing_uris son los URIs que ya tenía la playlist, necesarios para
+        repetir el mismo filtrado 'add_new' (y los mismos lotes) al reanudar.
+        """
+        self.flush()
+        with self.store.lock:
+            self.store.conn.execute(
+                "INSERT OR REPLACE INTO checkpoint_plans "
+                "(checkpoint_id, playlist_id, playlist_url, uris, tracks_count, created_at, pipelined, existing_uris) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.checkpoint_id, playlist_id, playlist_url, json.dumps(uris), tracks_count, time.time(),
+                 int(pipelined), json.dumps(existing_uris) if existing_uris else None),
+            )
+
+    def committed_batches(self) -> set:
+        """Retorna los índices de los lotes ya añadidos a la playlist."""
+        with self.store.lock:
+            rows = self.store.conn.execute(
+                "SELECT batch_index FROM checkpoint_batches WHERE checkpoint_id = ?", (self.checkpoint_id,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def commit_batch(self, batch_index: int) -> None:
+        """Marca un lote como añadido; se llama justo después de que Spotify lo confirme."""
+        with self.store.lock:
+            self.store.conn.execute(
+                "INSERT OR IGNORE INTO checkpoint_batches (checkpoint_id, batch_index) VALUES (?, ?)",
+                (self.checkpoint_id, batch_index),
+            )
+
+
+# ==========================
+#   Instancia compartida
+# ==========================
+
+_checkpoint_store = None
+_checkpoint_store_lock = threading.Lock()
+
+
+def get_checkpoint_store() -> CheckpointStore:
+    """Retorna el almacén de checkpoints del proceso, creándolo la primera vez."""
+    global _checkpoint_store
+    if _checkpoint_store is None:
+        with _checkpoint_store_lock:
+            if _checkpoint_store is None:
+                _checkpoint_store = CheckpointStore(CHECKPOINTS_DB_PATH)
+    return _checkpoint_store
@@ -0,0 +1,403 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import traceback
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from metrics import get_metrics, profiling, profile_path
+
+# ==========================
+#   Configuración de trabajos
+# ==========================
+
+# Fichero SQLite con el estado de los trabajos; al estar en disco, cualquier
+# proceso de la aplicación puede consultar un trabajo lanzado por otro.
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.sqlite3")
+# Importaciones que se ejecutan a la vez en cada proceso
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Tiempo que se conservan los trabajos terminados (segundos)
+JOB_RETENTION = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+# Cada proceso renueva el latido de sus trabajos pendientes cada JOB_HEARTBEAT_INTERVAL
+# segundos; un trabajo pendiente sin latido durante JOB_STALE_SECONDS se da por
+# perdido (su proceso murió o se reinició) y queda como fallido para poder reanudarlo.
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "15"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120"))
+STALE_JOB_ERROR = "El trabajo se interrumpió porque el proceso que lo ejecutaba se detuvo."
+
+# Los eventos por track se escriben en bloque cada EVENT_FLUSH_INTERVAL segundos
+EVENT_FLUSH_INTERVAL = 0.5
+_PER_TRACK_EVENTS = {"resolved", "not_found"}
+
+# Listas por track del resultado que se guardan fila a fila y se leen por páginas,
+# con la clave en la que el resultado conserva su número de elementos
+RESULT_LISTS = {"not_found_tracks": "not_found_count", "low_confidence_tracks": "low_confidence_count",
+                "resolved_tracks": "tracks_count"}
+# Elementos por página de esas listas (por defecto y máximo)
+RESULT_PAGE_SIZE = 100
+MAX_RESULT_PAGE_SIZE = 1000
+
+# Estados posibles de un trabajo
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class JobStore:
+    """
+    Almacén SQLite del estado y resultado de los trabajos.
+    Solo guarda datos no sensibles: las credenciales nunca se persisten.
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                   id TEXT PRIMARY KEY,
+                   status TEXT NOT NULL,
+                   meta TEXT,
+                   result TEXT,
+                   error TEXT,
+                   progress TEXT,
+                   created_at REAL NOT NULL,
+                   started_at REAL,
+                   finished_at REAL,
+                   heartbeat_at REAL
+               )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS job_events (
+                   seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                   job_id TEXT NOT NULL,
+                   data TEXT NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events(job_id, seq)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS job_result_items (
+                   job_id TEXT NOT NULL,
+                   name TEXT NOT NULL,
+                   position INTEGER NOT NULL,
+                   data TEXT NOT NULL,
+                   PRIMARY KEY (job_id, name, position)
+               ) WITHOUT ROWID"""
+        )
+        self._add_missing_columns("jobs", {"progress": "TEXT", "heartbeat_at": "REAL"})
+        self.fail_stale()
+        self.purge_expired()
+
+    def _add_missing_columns(self, table: str, columns: dict) -> None:
+        """Añade a una tabla existente las columnas que falten (bases de datos de versiones anteriores)."""
+        existing = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+        for name, column_type in columns.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+    def create(self, meta: dict = None) -> str:
+        """Registra un trabajo nuevo en estado 'queued' y retorna su ID."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, meta, created_at, heartbeat_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, STATUS_QUEUED, json.dumps(meta or {}), now, now),
+            )
+        return job_id
+
+    def mark_running(self, job_id: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                (STATUS_RUNNING, now, now, job_id),
+            )
+
+    def heartbeat(self, job_ids) -> None:
+        """Renueva el latido de los trabajos pendientes indicados."""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status IN (?, ?)",
+                [(time.time(), job_id, STATUS_QUEUED, STATUS_RUNNING) for job_id in job_ids],
+            )
+
+    def fail_stale(self, job_id: str = None) -> None:
+        """
+        Marca como fallidos los trabajos pendientes (en cola o en curso) sin latido
+        desde hace más de JOB_STALE_SECONDS, o solo job_id si se indica.
+        Conservan su meta (y con ella el checkpoint), así que pueden reanudarse.
+        """
+        now = time.time()
+        query = ("UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? "
+                 "WHERE status IN (?, ?) AND COALESCE(heartbeat_at, started_at, created_at) < ?")
+        params = [STATUS_FAILED, json.dumps({"error": STALE_JOB_ERROR}), STALE_JOB_ERROR, now,
+                  STATUS_QUEUED, STATUS_RUNNING, now - JOB_STALE_SECONDS]
+        if job_id is not None:
+            query += " AND id = ?"
+            params.append(job_id)
+        with self._lock:
+            self._conn.execute(query, params)
+
+    def finish(self, job_id: str, result: dict) -> None:
+        """
+        Guarda el resultado; si contiene 'error' el trabajo queda como fallido.
+        Las listas por track (RESULT_LISTS) se guardan fila a fila en job_result_items
+        y el resultado solo conserva su número de elementos (p. ej. not_found_count),
+        así que el tamaño del resultado no depende del de la lista de tracks.
+        """
+        status = STATUS_FAILED if "error" in result else STATUS_DONE
+        summary = dict(result)
+        lists = {}
+        for name, count_key in RESULT_LISTS.items():
+            items = summary.pop(name, None)
+            if items is not None:
+                lists[name] = items
+                summary[count_key] = len(items)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for name, items in lists.items():
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO job_result_items (job_id, name, position, data) VALUES (?, ?, ?, ?)",
+                        ((job_id, name, position, json.dumps(item)) for position, item in enumerate(items)),
+                    )
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                    (status, json.dumps(summary), result.get("error"), time.time(), job_id),
+                )
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def get(self, job_id: str) -> dict:
+        """
+        Retorna el estado del trabajo como diccionario
+        {id, status, meta, progress, error, created_at, started_at, finished_at},
+        o None si no existe. progress es el último evento de progreso registrado.
+        Un trabajo pendiente cuyo proceso dejó de renovar el latido se retorna como fallido.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, meta, progress, error, created_at, started_at, finished_at, heartbeat_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        if row["status"] in (STATUS_QUEUED, STATUS_RUNNING) and \
+                (row["heartbeat_at"] or row["started_at"] or row["created_at"]) < time.time() - JOB_STALE_SECONDS:
+            self.fail_stale(job_id)
+            return self.get(job_id)
+        job = dict(row)
+        del job["heartbeat_at"]
+        job["meta"] = json.loads(job["meta"] or "{}")
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+        return job
+
+    def get_result(self, job_id: str, page: int = 1, per_page: int = RESULT_PAGE_SIZE) -> dict:
+        """
+        Retorna el resultado del trabajo, o None si aún no ha terminado o no existe.
+        De las listas por track (RESULT_LISTS) solo se incluye la página `page`
+        (desde 1) de per_page elementos; el total de cada una está en su clave de
+        cuenta (p. ej. not_found_count) y el número de páginas
+        de la más larga en 'pages'.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row["result"] is None:
+            return None
+        result = json.loads(row["result"])
+        per_page = max(1, min(MAX_RESULT_PAGE_SIZE, per_page))
+        page = max(1, page)
+        offset = (page - 1) * per_page
+        pages = None
+        for name, count_key in RESULT_LISTS.items():
+            if name in result:
+                # Resultado guardado por una versión anterior: la lista completa está en el propio resultado
+                items = result[name]
+                result[count_key] = len(items)
+                result[name] = items[offset:offset + per_page]
+            elif count_key in result:
+                result[name] = self.get_result_items(job_id, name, offset, per_page)
+            else:
+                continue
+            pages = max(pages or 1, -(-result[count_key] // per_page))
+        if pages is not None:
+            result.update(page=page, per_page=per_page, pages=pages)
+        return result
+
+    def get_result_items(self, job_id: str, name: str, offset: int = 0, limit: int = RESULT_PAGE_SIZE) -> list:
+        """Retorna hasta `limit` elementos de la lista `name` del resultado a partir de offset."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM job_result_items WHERE job_id = ? AND name = ? AND position >= ? "
+                "ORDER BY position LIMIT ?",
+                (job_id, name, offset, limit),
+            ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def add_events(self, job_id: str, events: list) -> None:
+        """Añade eventos de progreso al trabajo y actualiza su último progreso."""
+        if not events:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO job_events (job_id, data) VALUES (?, ?)",
+                    [(job_id, json.dumps(event)) for event in events],
+                )
+                self._conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(events[-1]), job_id))
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def get_events(self, job_id: str, after_seq: int = 0, limit: int = 500) -> list:
+        """Retorna hasta `limit` eventos [(seq, evento)] del trabajo posteriores a after_seq."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (job_id, after_seq, limit),
+            ).fetchall()
+        return [(row["seq"], json.loads(row["data"])) for row in rows]
+
+    def purge_expired(self) -> None:
+        """Elimina los trabajos terminados hace más de JOB_RETENTION segundos."""
+        with self._lock:
+            cutoff = time.time() - JOB_RETENTION
+            self._conn.execute(
+                "DELETE FROM job_events WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?)",
+                (cutoff,),
+            )
+            self._conn.execute(
+                "DELETE FROM job_result_items WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?)",
+                (cutoff,),
+            )
+            self._conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (cutoff,),
+            )
+
+
+class _EventRecorder:
+    """
+    Callback de progreso que guarda los eventos de un trabajo en el JobStore.
+    Los eventos por track se acumulan y se escriben en bloque para no hacer
+    una escritura en disco por cada track.
+    """
+
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self, event: dict) -> None:
+        with self._lock:
+            self._buffer.append(event)
+            due = time.monotonic() - self._last_flush >= EVENT_FLUSH_INTERVAL
+            if event.get("event") not in _PER_TRACK_EVENTS or due:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        events, self._buffer = self._buffer, []
+        self._last_flush = time.monotonic()
+        try:
+            self.store.add_events(self.job_id, events)
+        except sqlite3.Error as e:
+            print(f"Error guardando eventos del trabajo {self.job_id}: {e}")
+
+
+class JobQueue:
+    """
+    Cola de trabajos en proceso: ejecuta las importaciones en un pool de hilos
+    y registra su estado y resultado en un JobStore.
+    Un hilo en segundo plano renueva el latido de los trabajos pendientes del
+    proceso, para que otros procesos detecten los que quedan huérfanos.
+    """
+
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS):
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job")
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True).start()
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(JOB_HEARTBEAT_INTERVAL)
+            with self._pending_lock:
+                job_ids = list(self._pending)
+            try:
+                self.store.heartbeat(job_ids)
+            except sqlite3.Error as e:
+                print(f"Error renovando el latido de los trabajos: {e}")
+
+    def submit(self, func, kwargs: dict, meta: dict = None, profile: bool = False) -> str:
+        """
+        Encola func(**kwargs) y retorna el ID del trabajo inmediatamente.
+        func debe aceptar progress_callback (recibe los eventos de progreso) y
+        retornar un diccionario de resultado (con 'error' si falla).
+        meta son datos públicos del trabajo (nombre de playlist, etc.).
+        Con profile, el trabajo se ejecuta bajo cProfile y el perfil se guarda
+        en metrics.profile_path(job_id) (salvo que JOB_PROFILE_DIR esté vacío).
+        """
+        job_id = self.store.create(meta)
+        with self._pending_lock:
+            self._pending.add(job_id)
+        self._executor.submit(self._run, job_id, func, kwargs, profile)
+        return job_id
+
+    def _run(self, job_id: str, func, kwargs: dict, profile: bool = False) -> None:
+        self.store.mark_running(job_id)
+        recorder = _EventRecorder(self.store, job_id)
+        path = profile_path(job_id) if profile else None
+        try:
+            with profiling(path) if path else nullcontext():
+                result = func(progress_callback=recorder, **kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            result = {"error": f"Error inesperado procesando el trabajo: {e}"}
+        recorder.flush()
+        try:
+            self.store.finish(job_id, result)
+        finally:
+            with self._pending_lock:
+                self._pending.discard(job_id)
+        get_metrics().inc("jobs_total", status=STATUS_FAILED if "error" in result else STATUS_DONE)
+
+
+# ==========================
+#   Instancia compartida
+# ==========================
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Retorna la cola de trabajos del proceso, creándola la primera vez."""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue(JobStore(JOBS_DB_PATH))
+    return _job_queue
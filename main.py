@@ -1,98 +1,37 @@
 import os
+import sys
 import json
-import spotipy
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from spotipy.oauth2 import SpotifyOAuth
+from spotify_logic import process_tracks, QueryCoalescer
+from track_ingest import iter_tracks
 
-# ==========================
-#    Funciones auxiliares
-# ==========================
-
-def build_advanced_query(track_info: dict) -> str:
-    """
-    Construye la cadena de búsqueda avanzada a partir de
-    los campos disponibles en track_info.
-    """
-    query_parts = []
-
-    # Mapeo directo campo -> formateo
-    if track_info.get("track"):
-        query_parts.append(f'track:"{track_info["track"]}"')
-    if track_info.get("artist"):
-        query_parts.append(f'artist:"{track_info["artist"]}"')
-    if track_info.get("album"):
-        query_parts.append(f'album:"{track_info["album"]}"')
-    if track_info.get("year"):
-        query_parts.append(f'year:{track_info["year"]}')
-    if track_info.get("upc"):
-        query_parts.append(f'upc:{track_info["upc"]}')
-    if track_info.get("tag"):
-        query_parts.append(f'tag:{track_info["tag"]}')
-    if track_info.get("isrc"):
-        query_parts.append(f'isrc:{track_info["isrc"]}')
-    if track_info.get("genre"):
-        query_parts.append(f'genre:"{track_info["genre"]}"')
-
-    return " ".join(query_parts).strip()
-
-def search_track(sp: spotipy.Spotify, query: str) -> str:
-    """
-    Realiza la búsqueda de un track en Spotify (limit=1).
-    Retorna el URI si existe o None en caso contrario.
-    """
-    if not query:
-        return None
-    result = sp.search(q=query, type="track", limit=1)
-    items = result.get("tracks", {}).get("items", [])
-    if items:
-        return items[0]["uri"]
-    return None
-
-def search_with_retry(sp: spotipy.Spotify, track_info: dict) -> str:
-    """
-    1. Intenta la búsqueda "avanzada" usando todos los campos disponibles.
-    2. En caso de no encontrar resultados, reintenta con track + artist.
-    3. Si aún no encuentra, reintenta con solo track.
-    Retorna el URI si lo encuentra, o None si no.
-    """
-    # 1. Búsqueda avanzada
-    advanced_query = build_advanced_query(track_info)
-    uri = search_track(sp, advanced_query)
-
-    # Si se encontró, retornamos
-    if uri:
-        return uri
-
-    # 2. Reintento: track + artist
-    if track_info.get("track") and track_info.get("artist"):
-        fallback_query_1 = f'track:"{track_info["track"]}" artist:"{track_info["artist"]}"'
-        uri = search_track(sp, fallback_query_1)
-        if uri:
-            return uri
-
-    # 3. Reintento final: solo track
-    if track_info.get("track"):
-        fallback_query_2 = f'track:"{track_info["track"]}"'
-        uri = search_track(sp, fallback_query_2)
-        if uri:
-            return uri
-
-    # No se encontró de ningún modo
-    return None
+# Extensiones de los archivos de tracks que se toman de un directorio
+TRACK_FILE_EXTENSIONS = ('.json', '.ndjson', '.jsonl')
+# Playlists que se importan a la vez en modo lote
+DEFAULT_CONCURRENCY = 4
+DEFAULT_PLAYLIST_NAME = "My Dynamic JSON Playlist evolution"
+DEFAULT_DESCRIPTION = "Playlist creada a partir de un archivo JSON"
 
 # ==========================
 #  Función principal
 # ==========================
 
-def create_spotify_playlist_from_file(json_file_path: str):
+def create_spotify_playlist_from_file(json_file_path: str, playlist_name: str = DEFAULT_PLAYLIST_NAME,
+                                      playlist_url: str = None, duplicate_option: str = 'add_all',
+                                      playlist_description: str = DEFAULT_DESCRIPTION, pipelined: bool = None) -> dict:
     """
-    Lee un archivo JSON (ej. tracks.json) con un array de canciones.
-      Cada objeto puede contener: 
+    Lee un archivo JSON (ej. tracks.json) con un array de canciones, o NDJSON.
+      Cada objeto puede contener:
           album, artist, track, year, upc, tag, isrc, genre.
     Crea una playlist y agrega los tracks encontrados.
     Si no encuentra un track con la búsqueda avanzada, hace un retry con:
       (1) track + artist, (2) solo track.
     Informa en el log si hay canciones que no se encontraron tras reintentos.
+    Retorna el resultado de process_tracks.
     """
 
     # 1. Cargar variables de entorno desde .env
@@ -101,59 +40,252 @@ def create_spotify_playlist_from_file(json_file_path: str):
     client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
     redirect_uri = os.getenv('SPOTIFY_REDIRECT_URI')
 
-    # 2. Inicializar Spotipy con OAuth
-    sp = spotipy.Spotify(
-        auth_manager=SpotifyOAuth(
+    # 2. Leer el JSON de forma incremental (array JSON o NDJSON) y procesarlo:
+    #    las búsquedas empiezan mientras el archivo aún se está leyendo.
+    with open(json_file_path, 'rb') as f:
+        result = process_tracks(
             client_id=client_id,
             client_secret=client_secret,
             redirect_uri=redirect_uri,
-            scope="playlist-modify-public playlist-modify-private"
+            tracks_data=iter_tracks(f),
+            playlist_name=playlist_name,
+            playlist_url=playlist_url,
+            duplicate_option=duplicate_option,
+            playlist_description=playlist_description,
+            pipelined=pipelined
         )
-    )
 
-    # Obtener ID de usuario
-    user_id = sp.current_user()["id"]
+    if "error" in result:
+        print(f"\nError: {result['error']}")
+        return result
 
-    # 3. Leer el contenido del JSON
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        tracks_data = json.load(f)
+    # 3. Logs de resultado
+    print(f"\nPlaylist creada: {playlist_name}")
+    print(f"Tracks agregados: {result['found_tracks_count']}")
+    print("URL de la playlist:", result["playlist_url"])
 
-    # 4. Crear la playlist
-    playlist_name = "My Dynamic JSON Playlist evolution"
-    new_playlist = sp.user_playlist_create(
-        user=user_id,
-        name=playlist_name,
-        public=True,
-        description="Playlist creada a partir de un archivo JSON"
-    )
+    if result["not_found_tracks"]:
+        print("\nNo se encontraron coincidencias para los siguientes items:")
+        for nf in result["not_found_tracks"]:
+            print(" -", nf)
+    return result
 
-    found_track_uris = []
-    not_found_tracks = []
+# ==========================
+#  Importación por lotes
+# ==========================
 
-    # 5. Procesar cada track e intentar encontrar su URI
-    for track_info in tracks_data:
-        uri = search_with_retry(sp, track_info)
-        if uri:
-            found_track_uris.append(uri)
+def load_playlist_definitions(paths: list, manifest_path: str = None) -> list:
+    """
+    Construye la lista de playlists a importar. Cada definición es un diccionario
+    {name, source, tracks, playlist_url, duplicate_option, description}, donde
+    tracks es la ruta de un archivo de tracks o la lista de tracks en línea.
+    - Cada ruta de `paths` puede ser un archivo de tracks (una playlist con el
+      nombre del archivo) o un directorio (una playlist por archivo .json,
+      .ndjson o .jsonl).
+    - El manifiesto es un JSON con una lista de definiciones (o {"playlists": [...]});
+      las rutas relativas se resuelven respecto al manifiesto.
+    Lanza ValueError si alguna definición no es válida.
+    """
+    definitions = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(name for name in os.listdir(path) if name.lower().endswith(TRACK_FILE_EXTENSIONS))
+            definitions.extend(_file_definition(os.path.join(path, name)) for name in files)
+        elif os.path.isfile(path):
+            definitions.append(_file_definition(path))
         else:
-            not_found_tracks.append(track_info)
+            raise ValueError(f"No existe el archivo o directorio: {path}")
 
-    # 6. Agregar los tracks encontrados a la playlist
-    if found_track_uris:
-        sp.playlist_add_items(new_playlist["id"], found_track_uris)
+    if manifest_path:
+        with open(manifest_path, 'r', encoding='utf-8-sig') as f:
+            manifest = json.load(f)
+        entries = manifest.get("playlists") if isinstance(manifest, dict) else manifest
+        if not isinstance(entries, list):
+            raise ValueError("El manifiesto debe ser una lista de playlists o un objeto con la clave 'playlists'.")
+        base_dir = os.path.dirname(os.path.abspath(manifest_path))
+        for position, entry in enumerate(entries):
+            definitions.append(_manifest_definition(entry, position, base_dir))
+    return definitions
 
-    # 7. Logs de resultado
-    print(f"\nPlaylist creada: {new_playlist['name']}")
-    print(f"Tracks agregados: {len(found_track_uris)}")
-    print("URL de la playlist:", new_playlist["external_urls"]["spotify"])
+def _file_definition(path: str) -> dict:
+    return {
+        "name": os.path.splitext(os.path.basename(path))[0],
+        "source": path,
+        "tracks": path,
+        "playlist_url": None,
+        "duplicate_option": 'add_all',
+        "description": DEFAULT_DESCRIPTION,
+    }
 
-    if not_found_tracks:
-        print("\nNo se encontraron coincidencias para los siguientes items:")
-        for nf in not_found_tracks:
-            print(" -", nf)
+def _manifest_definition(entry: dict, position: int, base_dir: str) -> dict:
+    if not isinstance(entry, dict):
+        raise ValueError(f"La entrada {position} del manifiesto no es un objeto JSON.")
+    tracks = entry.get("tracks")
+    if isinstance(tracks, str):
+        tracks = tracks if os.path.isabs(tracks) else os.path.join(base_dir, tracks)
+        source = tracks
+    elif isinstance(tracks, list):
+        source = f"manifiesto[{position}]"
+    else:
+        raise ValueError(f"La entrada {position} del manifiesto necesita 'tracks' (ruta de archivo o lista).")
+    name = entry.get("name") or (os.path.splitext(os.path.basename(tracks))[0] if isinstance(tracks, str) else None)
+    if not name and not entry.get("playlist_url"):
+        raise ValueError(f"La entrada {position} del manifiesto necesita 'name' o 'playlist_url'.")
+    duplicate_option = entry.get("duplicate_option", 'add_all')
+    if duplicate_option not in ('add_all', 'add_new', 'sync'):
+        raise ValueError(f"La entrada {position} del manifiesto tiene un duplicate_option no válido: {duplicate_option}")
+    return {
+        "name": name,
+        "source": source,
+        "tracks": tracks,
+        "playlist_url": entry.get("playlist_url"),
+        "duplicate_option": duplicate_option,
+        "description": entry.get("description") or DEFAULT_DESCRIPTION,
+    }
+
+def _checkpoint_id(definition: dict) -> str:
+    """ID de checkpoint estable para una definición: el mismo lote reanuda las mismas importaciones."""
+    key = json.dumps([definition["name"], definition["source"], definition["playlist_url"]])
+    return "cli:" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+def import_playlist(definition: dict, credentials: dict, queries: QueryCoalescer = None, resume: bool = False,
+                    pipelined: bool = None) -> dict:
+    """Importa una playlist del lote y retorna su entrada del informe."""
+    started = time.monotonic()
+    kwargs = dict(
+        credentials,
+        playlist_name=definition["name"],
+        playlist_url=definition["playlist_url"],
+        duplicate_option=definition["duplicate_option"],
+        playlist_description=definition["description"],
+        checkpoint_id=_checkpoint_id(definition) if resume else None,
+        queries=queries,
+        pipelined=pipelined,
+    )
+    try:
+        if isinstance(definition["tracks"], list):
+            result = process_tracks(tracks_data=definition["tracks"], **kwargs)
+        else:
+            with open(definition["tracks"], 'rb') as f:
+                result = process_tracks(tracks_data=iter_tracks(f), **kwargs)
+    except OSError as e:
+        result = {"error": f"No se pudo leer el archivo de tracks: {e}"}
+    except Exception as e:
+        # Un error inesperado en una playlist no debe abortar el lote ni impedir el informe
+        result = {"error": f"Error inesperado importando la playlist: {e}"}
+
+    entry = {
+        "name": definition["name"],
+        "source": definition["source"],
+        "status": "failed" if "error" in result else "done",
+        "seconds": round(time.monotonic() - started, 3),
+    }
+    if "error" in result:
+        entry["error"] = result["error"]
+    else:
+        entry.update({
+            "playlist_url": result["playlist_url"],
+            "found_tracks_count": result["found_tracks_count"],
+            "not_found_count": len(result["not_found_tracks"]),
+            "not_found_tracks": result["not_found_tracks"],
+            "low_confidence_count": len(result.get("low_confidence_tracks", [])),
+            "match_tiers": result.get("match_tiers", {}),
+        })
+    return entry
+
+def run_batch(definitions: list, concurrency: int = DEFAULT_CONCURRENCY, resume: bool = False,
+              pipelined: bool = None) -> dict:
+    """
+    Importa todas las playlists, varias a la vez. Comparten el cliente de Spotify,
+    la caché de búsquedas, el límite de peticiones del proceso y una misma memoria
+    de consultas, así que una canción repetida en varias playlists se busca una vez.
+    Retorna el informe del lote.
+    """
+    load_dotenv()
+    credentials = {
+        "client_id": os.getenv('SPOTIFY_CLIENT_ID'),
+        "client_secret": os.getenv('SPOTIFY_CLIENT_SECRET'),
+        "redirect_uri": os.getenv('SPOTIFY_REDIRECT_URI'),
+    }
+    queries = QueryCoalescer()
+    started_at = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="playlist") as executor:
+        futures = [executor.submit(import_playlist, definition, credentials, queries, resume, pipelined)
+                   for definition in definitions]
+        playlists = []
+        for definition, future in zip(definitions, futures):
+            entry = future.result()
+            status = "OK" if entry["status"] == "done" else f"ERROR: {entry['error']}"
+            print(f"[{len(playlists) + 1}/{len(definitions)}] {definition['name']}: {status}")
+            playlists.append(entry)
+
+    done = [entry for entry in playlists if entry["status"] == "done"]
+    return {
+        "started_at": started_at,
+        "finished_at": time.time(),
+        "seconds": round(time.time() - started_at, 3),
+        "playlists_count": len(playlists),
+        "done_count": len(done),
+        "failed_count": len(playlists) - len(done),
+        "found_tracks_count": sum(entry["found_tracks_count"] for entry in done),
+        "not_found_count": sum(entry["not_found_count"] for entry in done),
+        "reused_queries": queries.reused,
+        "playlists": playlists,
+    }
 
 # ==========================
 #   Punto de entrada
 # ==========================
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Crea playlists de Spotify a partir de archivos JSON/NDJSON de tracks."
+    )
+    parser.add_argument("paths", nargs="*",
+                        help="Archivos de tracks o directorios (una playlist por archivo). Por defecto tracks.json.")
+    parser.add_argument("-m", "--manifest", help="Manifiesto JSON con la lista de playlists a importar.")
+    parser.add_argument("-n", "--name", help="Nombre de la playlist (solo con un único archivo).")
+    parser.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"Playlists que se importan a la vez (por defecto {DEFAULT_CONCURRENCY}).")
+    parser.add_argument("-r", "--report", help="Escribe el informe del lote en este archivo JSON ('-' para la salida estándar).")
+    parser.add_argument("--resume", action="store_true",
+                        help="Guarda el avance de cada playlist y, al repetir el mismo lote, continúa donde se quedó.")
+    parser.add_argument("--pipelined", action="store_true", default=None,
+                        help="Añade los tracks a la playlist mientras se siguen buscando.")
+    args = parser.parse_args(argv)
+
+    # Uso clásico: un único archivo sin manifiesto ni informe
+    if not args.manifest and not args.report and len(args.paths) <= 1 and not args.resume \
+            and not (args.paths and os.path.isdir(args.paths[0])):
+        path = args.paths[0] if args.paths else "tracks.json"
+        result = create_spotify_playlist_from_file(path, playlist_name=args.name or DEFAULT_PLAYLIST_NAME,
+                                                   pipelined=args.pipelined)
+        return 1 if "error" in result else 0
+
+    try:
+        definitions = load_playlist_definitions(args.paths, args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    if args.name:
+        if len(definitions) != 1:
+            parser.error("--name solo se puede usar con una única playlist.")
+        definitions[0]["name"] = args.name
+    if not definitions:
+        print("Error: no hay playlists que importar.", file=sys.stderr)
+        return 2
+
+    report = run_batch(definitions, args.concurrency, args.resume, args.pipelined)
+    print(f"\nLote terminado en {report['seconds']}s: {report['done_count']} playlists creadas, "
+          f"{report['failed_count']} con error, {report['found_tracks_count']} tracks añadidos.")
+    if args.report == "-":
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    elif args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Informe guardado en {args.report}")
+    return 1 if report["failed_count"] else 0
+
 if __name__ == "__main__":
-    create_spotify_playlist_from_file("tracks.json")
\ No newline at end of file
+    sys.exit(main())
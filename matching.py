@@ -0,0 +1,132 @@
+import os
+import re
+from functools import lru_cache
+from search_cache import normalize_query
+
+# ==========================
+#   Configuración de la puntuación
+# ==========================
+
+# Puntuación mínima (0-1) para aceptar un candidato sin probar más consultas
+MATCH_THRESHOLD = float(os.getenv("SPOTIFY_MATCH_THRESHOLD", "0.8"))
+# Si ninguna consulta supera MATCH_THRESHOLD, se acepta el mejor candidato
+# visto siempre que llegue a este mínimo
+MATCH_MIN_SCORE = float(os.getenv("SPOTIFY_MATCH_MIN_SCORE", "0.5"))
+
+# Peso de cada campo; solo cuentan los que tienen tanto el track como el candidato
+_WEIGHTS = {"track": 0.55, "artist": 0.3, "album": 0.1, "year": 0.05}
+
+# "(Remastered 2011)", "[Live]", " - Radio Edit", "feat. X"...
+_DECORATIONS_RE = re.compile(r"\s*[\(\[][^\)\]]*[\)\]]|\s+-\s+.*$|\s+(feat|ft)\.?\s+.*$")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+# Entradas de cada memoria de normalización y bigramas. Son del proceso y duran
+# entre trabajos: basta con cubrir los textos repetidos de una lista (artistas,
+# álbumes, candidatos de las consultas recientes) sin crecer con su tamaño.
+_TEXT_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=_TEXT_CACHE_SIZE)
+def normalize_text(value) -> str:
+    """Normaliza un texto para compararlo: sin mayúsculas, signos ni espacios sobrantes."""
+    return normalize_query(_PUNCTUATION_RE.sub(" ", str(value or "")))
+
+
+@lru_cache(maxsize=_TEXT_CACHE_SIZE)
+def _strip_decorations(value) -> str:
+    return normalize_text(_DECORATIONS_RE.sub("", str(value or "")))
+
+
+@lru_cache(maxsize=_TEXT_CACHE_SIZE)
+def _bigrams(text: str) -> frozenset:
+    """Pares de caracteres consecutivos del texto (con un espacio en cada extremo)."""
+    padded = f" {text} "
+    return frozenset(padded[i:i + 2] for i in range(len(padded) - 1))
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    Similitud entre dos textos ya normalizados (0-1): coeficiente de
+    Sørensen-Dice sobre bigramas de caracteres. Es lineal en la longitud de
+    los textos y los bigramas de los textos recientes se memorizan, así que
+    puntuar muchos candidatos es barato. Los textos iguales o vacíos se
+    resuelven sin calcular bigramas.
+    """
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    first, second = _bigrams(a), _bigrams(b)
+    return 2 * len(first & second) / (len(first) + len(second))
+
+
+def _title_similarity(wanted: str, title: str) -> float:
+    """Compara títulos completos y sin adornos ("- Remastered", "(Live)"...)."""
+    full_wanted, full_title = normalize_text(wanted), normalize_text(title)
+    if full_wanted == full_title:
+        return 1.0
+    bare_wanted, bare_title = _strip_decorations(wanted), _strip_decorations(title)
+    # Misma canción con otro adorno (remaster, directo...): casi exacta, pero
+    # por debajo de la coincidencia literal para desempatar a favor de esta
+    if bare_wanted == bare_title:
+        return 0.95
+    return max(similarity(full_wanted, full_title), similarity(bare_wanted, bare_title))
+
+
+def _year_similarity(wanted, year) -> float:
+    try:
+        difference = abs(int(str(wanted)[:4]) - int(str(year)[:4]))
+    except ValueError:
+        return 0.0
+    return 1.0 if difference == 0 else 0.5 if difference == 1 else 0.0
+
+
+def score_candidate(track_info: dict, candidate: list, to_beat: float = 0.0) -> float:
+    """
+    Puntúa (0-1) un candidato [uri, título, [artistas], álbum, año] frente a
+    track_info, combinando la similitud de título, artista, álbum y año.
+    Los campos se evalúan de mayor a menor peso; si la puntuación máxima aún
+    alcanzable no supera to_beat se deja de calcular y se retorna 0.0.
+    """
+    _, title, artists, album, year = candidate
+    fields = []
+    if track_info.get("track") and title:
+        fields.append(("track", lambda: _title_similarity(track_info["track"], title)))
+    if track_info.get("artist") and artists:
+        fields.append(("artist", lambda: _artist_similarity(track_info["artist"], artists)))
+    if track_info.get("album") and album:
+        fields.append(("album", lambda: _title_similarity(track_info["album"], album)))
+    if track_info.get("year") and year:
+        fields.append(("year", lambda: _year_similarity(track_info["year"], year)))
+    if not fields:
+        return 0.0
+    total_weight = sum(_WEIGHTS[field] for field, _ in fields)
+    remaining = total_weight
+    score = 0.0
+    for field, compute in fields:
+        remaining -= _WEIGHTS[field]
+        score += _WEIGHTS[field] * compute()
+        if to_beat and (score + remaining) / total_weight <= to_beat:
+            return 0.0
+    return score / total_weight
+
+
+def _artist_similarity(wanted: str, artists: list) -> float:
+    """El artista indicado puede ser cualquiera de los del track, o todos juntos."""
+    wanted = normalize_text(wanted)
+    names = [normalize_text(artist) for artist in artists]
+    if wanted in names:
+        return 1.0
+    return max(similarity(wanted, name) for name in names + [" ".join(names)])
+
+
+def best_candidate(track_info: dict, candidates: list) -> tuple:
+    """Retorna (candidato, puntuación) del mejor candidato, o (None, 0.0) si no hay ninguno."""
+    best, best_score = None, 0.0
+    for candidate in candidates or []:
+        score = score_candidate(track_info, candidate, best_score)
+        if score > best_score:
+            best, best_score = candidate, score
+            if score >= 1.0:
+                # Coincidencia exacta en todos los campos: no hay nada mejor
+                break
+    return best, best_score
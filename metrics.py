@@ -0,0 +1,276 @@
+import os
+import time
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+# ==========================
+#   Configuración de métricas
+# ==========================
+
+# Límites (segundos) de los histogramas de duración
+TIMER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Directorio donde se guardan los perfiles de los trabajos que lo piden. Vacío lo desactiva.
+PROFILE_DIR = os.getenv("JOB_PROFILE_DIR", "profiles")
+
+# Texto de ayuda (HELP) de cada métrica en la exposición de Prometheus
+_DESCRIPTIONS = {
+    "spotify_api_requests_total": "Peticiones a la API de Spotify por endpoint (método de spotipy) y estado.",
+    "spotify_api_request_seconds": "Duración de las peticiones a la API de Spotify por endpoint.",
+    "import_stage_seconds": "Duración de cada etapa de una importación (parse, playlist_fetch, add_batch, sync_write, import) y de cada resolución sin playlist (resolve).",
+    "track_resolve_seconds": "Duración de la resolución de un track por el nivel de búsqueda que lo encontró.",
+    "cache_requests_total": "Consultas a cada caché (search, queries, playlist_index) por resultado (hit o miss).",
+    "cache_hit_ratio": "Proporción de aciertos de cada caché desde que arrancó el proceso.",
+    "jobs_total": "Trabajos terminados por estado.",
+}
+
+
+class MetricsRegistry:
+    """
+    Contadores e histogramas de duración del proceso, con etiquetas.
+    Es seguro entre hilos y barato de actualizar: cada operación es una suma
+    bajo un lock, así que puede usarse en el camino de cada track.
+    render() produce el formato de texto de Prometheus.
+    """
+
+    def __init__(self, buckets: tuple = TIMER_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._timers = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """Suma value al contador name con esas etiquetas."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """Registra una duración en el histograma name con esas etiquetas."""
+        key = self._key(name, labels)
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                # [número de observaciones, suma, observaciones por cubo]
+                timer = self._timers[key] = [0, 0.0, [0] * len(self.buckets)]
+            timer[0] += 1
+            timer[1] += seconds
+            for position, limit in enumerate(self.buckets):
+                if seconds <= limit:
+                    timer[2][position] += 1
+                    break
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Mide la duración del bloque y la registra en el histograma name."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def cache_hit_ratios(self) -> dict:
+        """Retorna {caché: proporción de aciertos} a partir de cache_requests_total."""
+        totals = {}
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                if name != "cache_requests_total":
+                    continue
+                labels = dict(labels)
+                hits, lookups = totals.get(labels.get("cache"), (0, 0))
+                totals[labels.get("cache")] = (hits + (value if labels.get("result") == "hit" else 0), lookups + value)
+        return {cache: hits / lookups for cache, (hits, lookups) in totals.items() if lookups}
+
+    def snapshot(self) -> dict:
+        """
+        Retorna las métricas como diccionario:
+        {counters: {nombre: [{labels, value}]}, timers: {nombre: [{labels, count, sum}]}, cache_hit_ratios}.
+        """
+        counters, timers = {}, {}
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                counters.setdefault(name, []).append({"labels": dict(labels), "value": value})
+            for (name, labels), (count, total, _) in sorted(self._timers.items()):
+                timers.setdefault(name, []).append({"labels": dict(labels), "count": count, "sum": total})
+        return {"counters": counters, "timers": timers, "cache_hit_ratios": self.cache_hit_ratios()}
+
+    def render(self) -> str:
+        """Retorna las métricas en el formato de texto de Prometheus (versión 0.0.4)."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            timers = sorted((key, (count, total, list(buckets))) for key, (count, total, buckets) in self._timers.items())
+        for name, samples in _group(counters):
+            _header(lines, name, "counter")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for name, samples in _group(timers):
+            _header(lines, name, "histogram")
+            for labels, (count, total, buckets) in samples:
+                cumulative = 0
+                for limit, observed in zip(self.buckets, buckets):
+                    cumulative += observed
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', _number(limit)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        ratios = self.cache_hit_ratios()
+        if ratios:
+            _header(lines, "cache_hit_ratio", "gauge")
+            for cache, ratio in sorted(ratios.items()):
+                lines.append(f"cache_hit_ratio{_labels((('cache', cache),))} {_number(ratio)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        """Pone a cero todas las métricas."""
+        with self._lock:
+            self._counters.clear()
+            self._timers.clear()
+
+
+def _group(items: list):
+    """Agrupa [((nombre, etiquetas), valor)] ordenados por nombre en (nombre, [(etiquetas, valor)])."""
+    current, samples = None, []
+    for (name, labels), value in items:
+        if name != current and samples:
+            yield current, samples
+            samples = []
+        current = name
+        samples.append((labels, value))
+    if samples:
+        yield current, samples
+
+
+def _header(lines: list, name: str, metric_type: str) -> None:
+    if name in _DESCRIPTIONS:
+        lines.append(f"# HELP {name} {_DESCRIPTIONS[name]}")
+    lines.append(f"# TYPE {name} {metric_type}")
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ==========================
+#   Perfilado por trabajo
+# ==========================
+
+class JobProfiler:
+    """
+    Perfil cProfile de un trabajo. cProfile solo mide el hilo en el que se
+    activa, así que cada hilo que trabaja para el trabajo (el del propio
+    trabajo, los de búsqueda y el que añade lotes) envuelve su parte con
+    section(); al terminar, dump() combina los perfiles de todos los hilos en
+    un único fichero .prof (legible con pstats o snakeviz).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def section(self):
+        """Perfila el bloque en el hilo actual; las secciones anidadas comparten el perfil del hilo."""
+        thread_id = threading.get_ident()
+        with self._lock:
+            entry = self._profiles.setdefault(thread_id, [cProfile.Profile(), 0])
+            entry[1] += 1
+            outermost = entry[1] == 1
+        enabled = False
+        if outermost:
+            try:
+                entry[0].enable()
+                enabled = True
+            except ValueError:
+                # Otro perfilador ya está activo en el intérprete (Python 3.12+): esta parte no se mide
+                pass
+        try:
+            yield
+        finally:
+            if enabled:
+                entry[0].disable()
+            with self._lock:
+                entry[1] -= 1
+
+    def dump(self) -> str:
+        """Guarda el perfil combinado en self.path y retorna la ruta (None si no se midió nada)."""
+        with self._lock:
+            profiles = [profile for profile, _ in self._profiles.values()]
+        import pstats
+        stats = None
+        for profile in profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError:
+                # Perfil de un hilo que nunca llegó a activarse
+                continue
+        if stats is None:
+            return None
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        stats.dump_stats(self.path)
+        return self.path
+
+
+# Perfil del trabajo en curso; los hilos de búsqueda reciben una copia del contexto
+_current_profiler = contextvars.ContextVar("job_profiler", default=None)
+
+
+@contextmanager
+def profiling(path: str):
+    """
+    Activa el perfilado del trabajo que corre dentro del bloque y guarda el
+    resultado en path al salir. Produce el JobProfiler.
+    """
+    profiler = JobProfiler(path)
+    token = _current_profiler.set(profiler)
+    try:
+        with profiler.section():
+            yield profiler
+    finally:
+        _current_profiler.reset(token)
+        try:
+            profiler.dump()
+        except OSError as e:
+            print(f"Error guardando el perfil en '{path}': {e}")
+
+
+def profile_section():
+    """Perfila el bloque si el trabajo actual se está perfilando; si no, no hace nada."""
+    profiler = _current_profiler.get()
+    return profiler.section() if profiler is not None else nullcontext()
+
+
+def profile_path(job_id: str) -> str:
+    """Ruta del perfil de un trabajo, o None si el perfilado está desactivado."""
+    return os.path.join(PROFILE_DIR, f"{job_id}.prof") if PROFILE_DIR else None
+
+
+# ==========================
+#   Instancia compartida
+# ==========================
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Retorna el registro de métricas compartido del proceso."""
+    return _registry
@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from metrics import get_metrics
+
+# ==========================
+#   Configuración del índice
+# ==========================
+
+# Fichero SQLite con el contenido conocido de cada playlist. Vacío lo desactiva.
+PLAYLIST_INDEX_PATH = os.getenv("PLAYLIST_INDEX_PATH", "playlist_index.sqlite3")
+# Número máximo de playlists guardadas (se eliminan primero las menos usadas)
+PLAYLIST_INDEX_MAX_ENTRIES = int(os.getenv("PLAYLIST_INDEX_MAX_ENTRIES", "1000"))
+
+
+class PlaylistIndexCache:
+    """
+    Caché SQLite del contenido de playlists, indexado por playlist_id y
+    snapshot_id. Spotify cambia el snapshot_id con cada modificación, así que
+    una entrada con el mismo snapshot describe exactamente la playlist actual.
+    Guarda la lista ordenada de URIs (None en las posiciones sin URI).
+    """
+
+    def __init__(self, path: str = PLAYLIST_INDEX_PATH, max_entries: int = PLAYLIST_INDEX_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS playlist_snapshots (
+                   playlist_id TEXT PRIMARY KEY,
+                   snapshot_id TEXT NOT NULL,
+                   uris TEXT NOT NULL,
+                   accessed_at REAL NOT NULL
+               )"""
+        )
+
+    def get(self, playlist_id: str, snapshot_id: str) -> list:
+        """Retorna los URIs de la playlist si hay una entrada para ese snapshot, o None."""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT uris FROM playlist_snapshots WHERE playlist_id = ? AND snapshot_id = ?",
+                    (playlist_id, snapshot_id),
+                ).fetchone()
+                if row is None:
+                    get_metrics().inc("cache_requests_total", cache="playlist_index", result="miss")
+                    return None
+                self._conn.execute(
+                    "UPDATE playlist_snapshots SET accessed_at = ? WHERE playlist_id = ?", (time.time(), playlist_id)
+                )
+            get_metrics().inc("cache_requests_total", cache="playlist_index", result="hit")
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            print(f"Error leyendo el índice de playlists: {e}")
+            return None
+
+    def put(self, playlist_id: str, snapshot_id: str, uris: list) -> None:
+        """Guarda el contenido de la playlist para ese snapshot (reemplaza el anterior)."""
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO playlist_snapshots (playlist_id, snapshot_id, uris, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (playlist_id, snapshot_id, json.dumps(uris), time.time()),
+                )
+                self._conn.execute(
+                    "DELETE FROM playlist_snapshots WHERE playlist_id IN "
+                    "(SELECT playlist_id FROM playlist_snapshots ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except sqlite3.Error as e:
+            print(f"Error escribiendo en el índice de playlists: {e}")
+
+
+# ==========================
+#   Instancia compartida
+# ==========================
+
+_shared_index = None
+_shared_index_lock = threading.Lock()
+
+
+def get_playlist_index():
+    """
+    Retorna el índice compartido del proceso, creándolo la primera vez.
+    Retorna None si está desactivado (PLAYLIST_INDEX_PATH vacío).
+    """
+    global _shared_index
+    if not PLAYLIST_INDEX_PATH:
+        return None
+    if _shared_index is None:
+        with _shared_index_lock:
+            if _shared_index is None:
+                try:
+                    _shared_index = PlaylistIndexCache(PLAYLIST_INDEX_PATH)
+                except sqlite3.Error as e:
+                    print(f"No se pudo abrir el índice de playlists '{PLAYLIST_INDEX_PATH}': {e}")
+                    return None
+    return _shared_index
@@ -0,0 +1,165 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import unicodedata
+from metrics import get_metrics
+
+# ==========================
+#   Configuración de caché
+# ==========================
+
+# Ruta del fichero SQLite. Una cadena vacía desactiva la caché.
+DEFAULT_CACHE_PATH = os.getenv("SPOTIFY_SEARCH_CACHE_PATH", "search_cache.sqlite3")
+# Tiempo de vida de los resultados encontrados y de los "no encontrados" (segundos)
+HIT_TTL = int(os.getenv("SPOTIFY_SEARCH_CACHE_HIT_TTL", str(30 * 24 * 3600)))
+MISS_TTL = int(os.getenv("SPOTIFY_SEARCH_CACHE_MISS_TTL", str(24 * 3600)))
+# Número máximo de entradas antes de expulsar las menos usadas (LRU)
+MAX_ENTRIES = int(os.getenv("SPOTIFY_SEARCH_CACHE_MAX_ENTRIES", "200000"))
+
+# Cada cuántas escrituras se comprueba el tamaño de la caché
+_EVICTION_CHECK_EVERY = 500
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normaliza una consulta para usarla como clave de caché:
+    Unicode NFKC, sin distinción de mayúsculas y espacios colapsados.
+    """
+    query = unicodedata.normalize("NFKC", query or "")
+    return _WHITESPACE_RE.sub(" ", query.casefold()).strip()
+
+
+class SearchCache:
+    """
+    Caché en disco (SQLite) de resultados de búsqueda.
+    Guarda tanto aciertos como resultados negativos (valor None), cada uno con
+    su propio TTL, y expulsa las entradas menos usadas cuando supera max_entries.
+    Es segura para usar desde varios hilos y varios procesos.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, hit_ttl: int = HIT_TTL,
+                 miss_ttl: int = MISS_TTL, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS search_cache (
+                   key TEXT PRIMARY KEY,
+                   value TEXT,
+                   found INTEGER NOT NULL,
+                   created_at REAL NOT NULL,
+                   accessed_at REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_accessed ON search_cache(accessed_at)")
+
+    def lookup(self, query: str) -> tuple:
+        """
+        Busca una consulta en la caché.
+        Retorna (True, valor) si hay una entrada vigente (valor puede ser None
+        si es un resultado negativo) o (False, None) si no la hay.
+        """
+        key = normalize_query(query)
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, found, created_at FROM search_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, found, created_at = row
+                    ttl = self.hit_ttl if found else self.miss_ttl
+                    if now - created_at < ttl:
+                        self._conn.execute("UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                        self.hits += 1
+                        get_metrics().inc("cache_requests_total", cache="search", result="hit")
+                        return True, json.loads(value) if found else None
+                self.misses += 1
+                get_metrics().inc("cache_requests_total", cache="search", result="miss")
+        except sqlite3.Error as e:
+            print(f"Error leyendo la caché de búsquedas: {e}")
+        return False, None
+
+    def store(self, query: str, value) -> None:
+        """
+        Guarda el resultado de una consulta. value=None registra un resultado negativo.
+        """
+        key = normalize_query(query)
+        now = time.time()
+        found = value is not None
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, value, found, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, json.dumps(value) if found else None, int(found), now, now),
+                )
+                self._writes += 1
+                if self._writes % _EVICTION_CHECK_EVERY == 0:
+                    self._evict()
+        except sqlite3.Error as e:
+            print(f"Error escribiendo en la caché de búsquedas: {e}")
+
+    def _evict(self) -> None:
+        """Elimina las entradas menos usadas recientemente por encima de max_entries."""
+        (size,) = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()
+        excess = size - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM search_cache WHERE key IN "
+                "(SELECT key FROM search_cache ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+
+    def stats(self) -> dict:
+        """Retorna los contadores de aciertos/fallos y el tamaño actual."""
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()
+            return {"hits": self.hits, "misses": self.misses, "size": size}
+
+    def clear(self) -> None:
+        """Vacía la caché y reinicia los contadores."""
+        with self._lock:
+            self._conn.execute("DELETE FROM search_cache")
+            self.hits = 0
+            self.misses = 0
+
+
+# ==========================
+#   Instancia compartida
+# ==========================
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_search_cache():
+    """
+    Retorna la caché compartida del proceso, creándola la primera vez.
+    Retorna None si la caché está desactivada (SPOTIFY_SEARCH_CACHE_PATH vacío).
+    """
+    global _shared_cache
+    if not DEFAULT_CACHE_PATH:
+        return None
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                try:
+                    _shared_cache = SearchCache(DEFAULT_CACHE_PATH)
+                except sqlite3.Error as e:
+                    print(f"No se pudo abrir la caché de búsquedas '{DEFAULT_CACHE_PATH}': {e}")
+                    return None
+    return _shared_cache
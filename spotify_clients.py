@@ -0,0 +1,206 @@
+import os
+import time
+import hashlib
+import threading
+import spotipy
+from spotipy.oauth2 import SpotifyOAuth, SpotifyClientCredentials
+from spotipy.cache_handler import CacheHandler, CacheFileHandler
+from spotify_scheduler import get_scheduler, get_http_session
+
+# ==========================
+#   Configuración de clientes
+# ==========================
+
+# URL base de la API; permite apuntar a un servidor local (p. ej. bench/mock_spotify.py)
+SPOTIFY_API_PREFIX = os.getenv("SPOTIFY_API_PREFIX")
+# Fichero donde se guarda el token OAuth entre ejecuciones (el mismo que usa spotipy por defecto)
+TOKEN_CACHE_PATH = os.getenv("SPOTIFY_TOKEN_CACHE_PATH", ".cache")
+# El token se renueva cuando le quedan menos de estos segundos de validez
+TOKEN_REFRESH_MARGIN = int(os.getenv("SPOTIFY_TOKEN_REFRESH_MARGIN", "300"))
+
+OAUTH_SCOPE = "playlist-modify-public playlist-modify-private"
+
+
+class _SharedTokenCache(CacheHandler):
+    """
+    Caché del token en memoria respaldada por un fichero.
+    El fichero solo se lee la primera vez (o mientras no haya token, por si otro
+    proceso completa el login) y solo se escribe cuando el token cambia, en lugar
+    de leerlo en cada petición como hace CacheFileHandler.
+    """
+
+    def __init__(self, path: str):
+        self._file = CacheFileHandler(cache_path=path) if path else None
+        self._token = None
+
+    def get_cached_token(self):
+        if self._token is None and self._file is not None:
+            self._token = self._file.get_cached_token()
+        return self._token
+
+    def save_token_to_cache(self, token_info):
+        self._token = token_info
+        if self._file is not None:
+            self._file.save_token_to_cache(token_info)
+
+
+class _SharedOAuth(SpotifyOAuth):
+    """
+    SpotifyOAuth seguro entre hilos: solo un hilo a la vez consulta o renueva
+    el token, y se renueva TOKEN_REFRESH_MARGIN segundos antes de caducar para
+    que ninguna petición en vuelo llegue con un token vencido.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._token_lock = threading.Lock()
+
+    def get_access_token(self, code=None, as_dict=True, check_cache=True):
+        with self._token_lock:
+            return super().get_access_token(code, as_dict=as_dict, check_cache=check_cache)
+
+    @staticmethod
+    def is_token_expired(token_info):
+        return token_info["expires_at"] - int(time.time()) < TOKEN_REFRESH_MARGIN
+
+
+class _SharedClientCredentials(SpotifyClientCredentials):
+    """
+    Flujo client credentials (token de la aplicación, sin usuario) con las
+    mismas garantías que _SharedOAuth: un solo hilo a la vez consulta o pide
+    el token y se renueva TOKEN_REFRESH_MARGIN segundos antes de caducar.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._token_lock = threading.Lock()
+
+    def get_access_token(self, as_dict=True, check_cache=True):
+        with self._token_lock:
+            return super().get_access_token(as_dict=as_dict, check_cache=check_cache)
+
+    @staticmethod
+    def is_token_expired(token_info):
+        return _SharedOAuth.is_token_expired(token_info)
+
+
+class PooledClient:
+    """Cliente de Spotify compartido por todas las importaciones de unas mismas credenciales."""
+
+    def __init__(self, sp: spotipy.Spotify):
+        self.sp = sp
+        self._user_id = None
+        self._lock = threading.Lock()
+
+    def user_id(self) -> str:
+        """Retorna el ID del usuario autenticado; solo se consulta a Spotify la primera vez."""
+        if self._user_id is None:
+            with self._lock:
+                if self._user_id is None:
+                    self._user_id = get_scheduler().call(self.sp.current_user)["id"]
+        return self._user_id
+
+
+class ClientPool:
+    """
+    Clientes de Spotify del proceso, indexados por credenciales (client_id,
+    client_secret, redirect_uri) y usuario. Reutiliza el cliente, su token y el
+    ID de usuario entre importaciones e hilos, de modo que iniciar una
+    importación no cuesta ninguna petición adicional.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(client_id: str, client_secret: str, redirect_uri: str, username: str) -> tuple:
+        # El secreto solo se guarda como hash, para distinguir credenciales distintas
+        secret = hashlib.sha256((client_secret or "").encode("utf-8")).hexdigest()
+        return client_id, secret, redirect_uri, username
+
+    def get(self, client_id: str, client_secret: str, redirect_uri: str, username: str = None) -> PooledClient:
+        """Retorna el cliente de esas credenciales, creándolo la primera vez."""
+        key = self._key(client_id, client_secret, redirect_uri, username)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = PooledClient(
+                    _build_client(client_id, client_secret, redirect_uri, username)
+                )
+        return client
+
+    def get_app(self, client_id: str, client_secret: str) -> PooledClient:
+        """
+        Retorna el cliente de la aplicación (flujo client credentials, sin
+        usuario), creándolo la primera vez. Sirve para buscar pero no para
+        leer ni modificar playlists del usuario. Se olvida con
+        discard(client_id, client_secret, None).
+        """
+        key = self._key(client_id, client_secret, None, None)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = PooledClient(_build_app_client(client_id, client_secret))
+        return client
+
+    def discard(self, client_id: str, client_secret: str, redirect_uri: str, username: str = None) -> None:
+        """Olvida el cliente (p. ej. tras un error de autenticación) para crearlo de nuevo en el siguiente uso."""
+        with self._lock:
+            self._clients.pop(self._key(client_id, client_secret, redirect_uri, username), None)
+
+
+def _build_client(client_id: str, client_secret: str, redirect_uri: str, username: str = None) -> spotipy.Spotify:
+    """
+    Crea un cliente de Spotify autenticado con OAuth que reutiliza la sesión HTTP
+    compartida del proceso. Los reintentos los gestiona el planificador, no spotipy.
+    """
+    session = get_http_session()
+    cache_path = f"{TOKEN_CACHE_PATH}-{username}" if username and TOKEN_CACHE_PATH else TOKEN_CACHE_PATH
+    client = spotipy.Spotify(
+        auth_manager=_SharedOAuth(
+            client_id=client_id,
+            client_secret=client_secret,
+            redirect_uri=redirect_uri,
+            scope=OAUTH_SCOPE,
+            cache_handler=_SharedTokenCache(cache_path),
+            requests_session=session
+        ),
+        requests_session=session
+    )
+    if SPOTIFY_API_PREFIX:
+        client.prefix = SPOTIFY_API_PREFIX
+    return client
+
+
+def _build_app_client(client_id: str, client_secret: str) -> spotipy.Spotify:
+    """
+    Crea un cliente de Spotify con el token de la aplicación (client credentials).
+    El token se guarda en su propio fichero, junto al de OAuth, para no mezclarlos.
+    """
+    session = get_http_session()
+    cache_path = f"{TOKEN_CACHE_PATH}-app-{client_id}" if TOKEN_CACHE_PATH else None
+    client = spotipy.Spotify(
+        auth_manager=_SharedClientCredentials(
+            client_id=client_id,
+            client_secret=client_secret,
+            cache_handler=_SharedTokenCache(cache_path),
+            requests_session=session
+        ),
+        requests_session=session
+    )
+    if SPOTIFY_API_PREFIX:
+        client.prefix = SPOTIFY_API_PREFIX
+    return client
+
+
+# ==========================
+#   Instancia compartida
+# ==========================
+
+_client_pool = ClientPool()
+
+
+def get_client_pool() -> ClientPool:
+    """Retorna el conjunto de clientes compartido del proceso."""
+    return _client_pool
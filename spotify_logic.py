@@ -1,7 +1,111 @@
 import os
 import json
+import time
+import queue
+import bisect
+import threading
+import contextvars
+from collections import deque, Counter, defaultdict, OrderedDict
+from typing import Iterable
+from concurrent.futures import ThreadPoolExecutor, Future
 import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+import requests
+from search_cache import get_search_cache, normalize_query
+from matching import best_candidate, MATCH_THRESHOLD, MATCH_MIN_SCORE
+from checkpoints import get_checkpoint_store, CheckpointMismatch
+from playlist_index import get_playlist_index
+from spotify_scheduler import get_scheduler
+from spotify_clients import get_client_pool
+from metrics import get_metrics, profile_section
+from track_ingest import TrackRecord
+from catalog import get_catalog
+
+# ==========================
+#        Concurrencia
+# ==========================
+
+# Búsquedas simultáneas por importación (configurable por entorno o por llamada)
+DEFAULT_MAX_WORKERS = int(os.getenv("SPOTIFY_MAX_WORKERS", "8"))
+# Tracks leídos por adelantado por cada hilo de búsqueda; acota la memoria
+# cuando la entrada es un generador muy grande.
+_PENDING_PER_WORKER = 4
+# Candidatos que se piden en cada búsqueda por texto para puntuarlos localmente
+SEARCH_CANDIDATES = max(1, min(50, int(os.getenv("SPOTIFY_SEARCH_CANDIDATES", "5"))))
+# Consultas terminadas que recuerda cada QueryCoalescer (las menos usadas se olvidan
+# primero); acota su memoria en listas muy grandes o en lotes de muchas playlists
+QUERY_MEMORY_SIZE = max(1, int(os.getenv("SPOTIFY_QUERY_MEMORY_SIZE", "5000")))
+
+# Modo por defecto de process_tracks: añadir los lotes mientras se busca
+PIPELINED_IMPORT = os.getenv("SPOTIFY_PIPELINED_IMPORT", "0").lower() in ("1", "true", "yes")
+
+# El presupuesto global de peticiones (ritmo, peticiones en vuelo y reintentos)
+# lo aplica el planificador compartido de spotify_scheduler.
+_scheduler = get_scheduler()
+
+# ==========================
+#     Eventos de progreso
+# ==========================
+
+class ProgressTracker:
+    """
+    Emite eventos estructurados de progreso de una importación.
+    Cada evento es un diccionario con la clave 'event', los campos propios del
+    evento y el estado global: processed, total, elapsed, tracks_per_second
+    y eta_seconds (None si aún no se puede estimar).
+    """
+
+    def __init__(self, total: int = None, callback=None):
+        self.total = total
+        self.callback = callback
+        self.processed = 0
+        self._started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def track_done(self, event: str, **fields) -> None:
+        """Cuenta un track procesado y emite su evento."""
+        with self._lock:
+            self.processed += 1
+        self.emit(event, **fields)
+
+    def emit(self, event: str, message: str = None, **fields) -> None:
+        """Emite un evento; si tiene mensaje, también se muestra por consola."""
+        if message:
+            print(message)
+        if self.callback is None:
+            return
+        elapsed = time.monotonic() - self._started_at
+        processed = self.processed
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.total is not None and rate > 0:
+            eta = round(max(0, self.total - processed) / rate, 1)
+        data = {
+            "event": event,
+            **fields,
+            "processed": processed,
+            "total": self.total,
+            "elapsed": round(elapsed, 2),
+            "tracks_per_second": round(rate, 2),
+            "eta_seconds": eta,
+        }
+        if message:
+            data["message"] = message
+        try:
+            self.callback(data)
+        except Exception as e:
+            # Un fallo al notificar nunca debe interrumpir la importación
+            print(f"Error notificando progreso: {e}")
+
+# Tracker de la importación en curso; los hilos de búsqueda reciben una copia del contexto
+_current_tracker = contextvars.ContextVar("progress_tracker", default=None)
+
+def _emit(event: str, message: str = None, **fields) -> None:
+    """Emite un evento en el tracker actual, o solo imprime el mensaje si no hay ninguno."""
+    tracker = _current_tracker.get()
+    if tracker is not None:
+        tracker.emit(event, message, **fields)
+    elif message:
+        print(message)
 
 # ==========================
 #    Funciones auxiliares
@@ -11,6 +115,8 @@ def build_advanced_query(track_info: dict) -> str:
     """
     Construye la cadena de búsqueda avanzada a partir de
     los campos disponibles en track_info.
+    Los identificadores (isrc, upc) no se incluyen: _resolve_track los busca
+    por separado (search_by_isrc, search_by_upc) antes que el texto.
     """
     query_parts = []
     if track_info.get("track"):
@@ -21,56 +127,628 @@ def build_advanced_query(track_info: dict) -> str:
         query_parts.append(f'album:"{track_info["album"]}"')
     if track_info.get("year"):
         query_parts.append(f'year:{track_info["year"]}')
-    if track_info.get("upc"):
-        query_parts.append(f'upc:{track_info["upc"]}')
     if track_info.get("tag"):
         query_parts.append(f'tag:{track_info["tag"]}')
-    if track_info.get("isrc"):
-        query_parts.append(f'isrc:{track_info["isrc"]}')
     if track_info.get("genre"):
         query_parts.append(f'genre:"{track_info["genre"]}"')
     return " ".join(query_parts).strip()
 
-def search_track(sp: spotipy.Spotify, query: str) -> str:
+# Errores de búsqueda que solo afectan a esa consulta (consulta no válida o sin
+# resultado) y se tratan como "no encontrado". Los demás (401/403 de un token
+# revocado o sin permisos, 429 o 5xx tras agotar los reintentos) se propagan y
+# terminan la importación en lugar de dar por perdida toda la lista.
+_SEARCH_MISS_STATUS = (400, 404)
+
+def _search_miss(error: spotipy.exceptions.SpotifyException, query: str) -> None:
+    """Relanza error salvo que signifique "no encontrado" para esta consulta (en ese caso lo emite)."""
+    if error.http_status not in _SEARCH_MISS_STATUS:
+        raise error
+    _emit("search_error", f"Error buscando '{query}': {error}", query=query, status=error.http_status)
+
+def search_track(sp: spotipy.Spotify, query: str, queries: "QueryCoalescer" = None) -> str:
     """
     Realiza la búsqueda de un track en Spotify (limit=1).
     Retorna el URI si existe o None en caso contrario.
+    Los resultados (incluidos los negativos) se guardan en la caché de búsquedas;
+    los errores de la API no se cachean. Solo una consulta no válida (400) o
+    sin resultado (404) cuenta como "no encontrado"; cualquier otro error
+    (401, 403, 429 o 5xx tras los reintentos) se propaga.
+    Con queries (QueryCoalescer de la importación), cada consulta distinta se
+    lanza como mucho una vez: las repetidas reutilizan el resultado o esperan
+    a la que ya está en vuelo.
     """
     if not query:
         return None
+    if queries is not None:
+        return queries.run(normalize_query(query), lambda: search_track(sp, query))
+    cache = get_search_cache()
+    if cache is not None:
+        cached, uri = cache.lookup(query)
+        if cached:
+            return uri
     try:
-        result = sp.search(q=query, type="track", limit=1)
-        items = result.get("tracks", {}).get("items", [])
-        if items:
-            return items[0]["uri"]
+        result = _scheduler.call(sp.search, q=query, type="track", limit=1)
     except spotipy.exceptions.SpotifyException as e:
-        print(f"Error buscando track '{query}': {e}")
+        _search_miss(e, query)
+        return None
+    items = result.get("tracks", {}).get("items", [])
+    uri = items[0]["uri"] if items else None
+    if cache is not None:
+        cache.store(query, uri)
+    return uri
+
+def search_candidates(sp: spotipy.Spotify, query: str, queries: "QueryCoalescer" = None) -> list:
+    """
+    Busca en Spotify hasta SEARCH_CANDIDATES tracks para la consulta y los
+    retorna como [uri, título, [artistas], álbum, año] (lista vacía si no hay).
+    Usa la caché de búsquedas, la memoria de consultas y el tratamiento de
+    errores de search_track, con claves propias para no mezclar listas de candidatos con URIs sueltos.
+    """
+    if not query:
+        return []
+    cache_key = f"candidates:{SEARCH_CANDIDATES}:{query}"
+    if queries is not None:
+        return queries.run(normalize_query(cache_key), lambda: search_candidates(sp, query))
+    cache = get_search_cache()
+    if cache is not None:
+        cached, candidates = cache.lookup(cache_key)
+        if cached:
+            return candidates or []
+    try:
+        result = _scheduler.call(sp.search, q=query, type="track", limit=SEARCH_CANDIDATES)
+    except spotipy.exceptions.SpotifyException as e:
+        _search_miss(e, query)
+        return []
+    candidates = []
+    for item in result.get("tracks", {}).get("items", []):
+        if not item or not item.get("uri"):
+            continue
+        album = item.get("album") or {}
+        candidates.append([
+            item["uri"],
+            item.get("name"),
+            [artist.get("name") for artist in item.get("artists", []) if artist.get("name")],
+            album.get("name"),
+            (album.get("release_date") or "")[:4] or None,
+        ])
+    if cache is not None:
+        cache.store(cache_key, candidates or None)
+    return candidates
+
+def _normalize_identifier(value) -> str:
+    """Normaliza un ISRC/UPC: sin espacios ni guiones y en mayúsculas."""
+    return "".join(str(value).split()).replace("-", "").upper()
+
+def search_by_isrc(sp: spotipy.Spotify, isrc: str, queries: "QueryCoalescer" = None) -> str:
+    """
+    Busca un track únicamente por su ISRC (coincidencia exacta).
+    Retorna el URI si existe o None en caso contrario.
+    """
+    return search_track(sp, f"isrc:{_normalize_identifier(isrc)}", queries)
+
+def get_album_tracks_by_upc(sp: spotipy.Spotify, upc: str, queries: "QueryCoalescer" = None) -> list:
+    """
+    Obtiene la lista de tracks [nombre, URI] del álbum con el UPC indicado.
+    El resultado (incluido el negativo) se guarda en la caché de búsquedas, y
+    con queries los tracks del mismo álbum que se resuelven en paralelo esperan
+    a una única consulta en vuelo, de modo que todos se resuelven con una sola
+    consulta del álbum. Retorna una lista vacía si no se encuentra.
+    """
+    upc = _normalize_identifier(upc)
+    cache_key = f"upc-album-tracks:{upc}"
+    if queries is not None:
+        return queries.run(cache_key, lambda: get_album_tracks_by_upc(sp, upc))
+    cache = get_search_cache()
+    if cache is not None:
+        cached, album_tracks = cache.lookup(cache_key)
+        if cached:
+            return album_tracks or []
+    try:
+        result = _scheduler.call(sp.search, q=f"upc:{upc}", type="album", limit=1)
+        albums = result.get("albums", {}).get("items", [])
+        album_tracks = []
+        if albums:
+            page = _scheduler.call(sp.album_tracks, albums[0]["id"], limit=50)
+            while page:
+                album_tracks.extend([item["name"], item["uri"]] for item in page.get("items", []))
+                page = _scheduler.call(sp.next, page) if page.get("next") else None
+    except spotipy.exceptions.SpotifyException as e:
+        _search_miss(e, f"upc:{upc}")
+        return []
+    if cache is not None:
+        cache.store(cache_key, album_tracks or None)
+    return album_tracks
+
+def search_by_upc(sp: spotipy.Spotify, upc: str, track_name: str = None, queries: "QueryCoalescer" = None) -> str:
+    """
+    Busca un track dentro del álbum identificado por su UPC.
+    Si se conoce el nombre del track se elige el que coincida (normalizado);
+    si no, solo se acepta el álbum cuando tiene un único track.
+    """
+    album_tracks = get_album_tracks_by_upc(sp, upc, queries)
+    if track_name:
+        wanted = normalize_query(track_name)
+        for name, uri in album_tracks:
+            if normalize_query(name) == wanted:
+                return uri
+        return None
+    if len(album_tracks) == 1:
+        return album_tracks[0][1]
     return None
 
-def search_with_retry(sp: spotipy.Spotify, track_info: dict) -> str:
+# ==========================
+#   Plan de consultas por track
+# ==========================
+
+# Niveles de búsqueda, en el orden en que se prueban
+TIER_ISRC = "isrc"
+TIER_UPC = "upc"
+TIER_ADVANCED = "advanced"
+TIER_TRACK_ARTIST = "track_artist"
+TIER_TRACK = "track"
+# Track ya resuelto en un checkpoint anterior (no se busca)
+TIER_CHECKPOINT = "checkpoint"
+# Track conocido por el catálogo local (no se busca)
+TIER_CATALOG = "catalog"
+# Track que ya trae su URI en la entrada, p. ej. un manifiesto de resolve_tracks (no se busca)
+TIER_URI = "uri"
+
+class QueryCoalescer:
     """
-    1. Intenta la búsqueda "avanzada".
-    2. Reintenta con track + artist.
-    3. Reintenta con solo track.
+    Memoria de consultas de una importación, compartida por sus hilos de búsqueda.
+    run(key, fn) ejecuta fn() la primera vez que aparece key y reutiliza su
+    resultado en las siguientes; si otra búsqueda con la misma key está en
+    vuelo, espera a que termine en lugar de lanzar otra petición.
+    Los errores no se memorizan: se propagan a quien esperaba y la siguiente
+    llamada lo vuelve a intentar. Las consultas reutilizadas cuentan como
+    aciertos de la caché "queries" en las métricas.
+    Solo se recuerdan las max_entries consultas usadas más recientemente: la
+    memoria no crece con la lista, y una consulta olvidada que se repite
+    vuelve a pasar por la caché de búsquedas antes de salir a la red.
     """
-    advanced_query = build_advanced_query(track_info)
-    uri = search_track(sp, advanced_query)
-    if uri:
-        return uri
 
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or QUERY_MEMORY_SIZE
+        self._results = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.reused = 0
+
+    def run(self, key: str, fn):
+        with self._lock:
+            if key in self._results:
+                self.reused += 1
+                self._results.move_to_end(key)
+                get_metrics().inc("cache_requests_total", cache="queries", result="hit")
+                return self._results[key]
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+            else:
+                self.reused += 1
+        get_metrics().inc("cache_requests_total", cache="queries", result="miss" if owner else "hit")
+        if not owner:
+            return future.result()
+        try:
+            value = fn()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            # Los resultados terminados se guardan sin el Future (ocupan mucha menos memoria)
+            self._results[key] = value
+            if len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+            del self._in_flight[key]
+        future.set_result(value)
+        return value
+
+def normalize_entry(track_info: dict) -> dict:
+    """
+    Retorna una copia de track_info con los textos sin espacios sobrantes y sin
+    los campos vacíos, para que entradas equivalentes generen las mismas consultas.
+    Un TrackRecord ya está normalizado y se retorna tal cual.
+    """
+    if isinstance(track_info, TrackRecord):
+        return track_info
+    entry = {}
+    for key, value in track_info.items():
+        if isinstance(value, str):
+            value = " ".join(value.split())
+        if value not in (None, ""):
+            entry[key] = value
+    return entry
+
+def plan_queries(track_info: dict) -> list:
+    """
+    Retorna las consultas de texto del track como [(nivel, consulta)], en orden:
+    track + artist, búsqueda avanzada y solo track. La primera es la más amplia
+    que aún identifica la canción: álbum y año se comparan localmente al puntuar
+    los candidatos, y la avanzada solo se usa si ningún candidato convence.
+    Las consultas que coinciden (p. ej. la avanzada de un track sin álbum ni año
+    es igual a track + artist) aparecen una sola vez, con el primer nivel que las genera.
+    """
+    candidates = []
     if track_info.get("track") and track_info.get("artist"):
-        fallback_query_1 = f'track:"{track_info["track"]}" artist:"{track_info["artist"]}"'
-        uri = search_track(sp, fallback_query_1)
+        candidates.append((TIER_TRACK_ARTIST, f'track:"{track_info["track"]}" artist:"{track_info["artist"]}"'))
+    candidates.append((TIER_ADVANCED, build_advanced_query(track_info)))
+    if track_info.get("track"):
+        candidates.append((TIER_TRACK, f'track:"{track_info["track"]}"'))
+    plan, seen = [], set()
+    for tier, query in candidates:
+        key = normalize_query(query)
+        if key and key not in seen:
+            seen.add(key)
+            plan.append((tier, query))
+    return plan
+
+def resolve_track(sp: spotipy.Spotify, track_info: dict, queries: QueryCoalescer = None) -> tuple:
+    """
+    Resuelve un track y retorna (uri, nivel, confianza), o (None, None, 0.0) si no se encontró.
+    Si el track ya trae 'uri' (p. ej. un manifiesto de resolve_tracks) se usa tal cual. Si no:
+    0. Consulta el catálogo local (por ISRC o, si no tiene ISRC ni UPC, por
+       título y artista, ver catalog.CatalogIndex); si lo conoce, no se hace
+       ninguna petición.
+    1. Si hay ISRC/UPC, busca por identificador exacto y termina si lo encuentra
+       (confianza 1.0).
+    2. Prueba en orden las consultas de plan_queries. Cada una trae varios
+       candidatos que se puntúan localmente (título, artista, álbum y año, ver
+       matching.score_candidate); la primera cuyo mejor candidato supera
+       MATCH_THRESHOLD termina la búsqueda.
+    3. Si ninguna lo supera, acepta el mejor candidato visto si llega a MATCH_MIN_SCORE.
+    Las resoluciones por búsqueda con confianza suficiente se añaden al catálogo.
+    Con queries, las consultas repetidas dentro de la importación no vuelven a
+    la red (ver QueryCoalescer). La duración se registra en track_resolve_seconds
+    con el nivel que lo encontró ("not_found" si no se encontró).
+    """
+    started = time.perf_counter()
+    uri, tier, confidence = _resolve_track(sp, track_info, queries)
+    get_metrics().observe("track_resolve_seconds", time.perf_counter() - started, tier=tier or "not_found")
+    return uri, tier, confidence
+
+def _resolve_track(sp: spotipy.Spotify, track_info: dict, queries: QueryCoalescer = None) -> tuple:
+    entry = normalize_entry(track_info)
+    if entry.get("uri"):
+        return entry["uri"], TIER_URI, 1.0
+    catalog = get_catalog()
+    if catalog is not None:
+        uri, confidence = catalog.lookup(entry)
         if uri:
-            return uri
+            return uri, TIER_CATALOG, confidence
+    uri, tier, confidence = _search_track(sp, entry, queries)
+    if catalog is not None and uri:
+        catalog.learn(entry, uri, confidence, by_isrc=tier == TIER_ISRC)
+    return uri, tier, confidence
 
-    if track_info.get("track"):
-        fallback_query_2 = f'track:"{track_info["track"]}"'
-        uri = search_track(sp, fallback_query_2)
+def _search_track(sp: spotipy.Spotify, entry: dict, queries: QueryCoalescer = None) -> tuple:
+    """Pasos 1-3 de resolve_track: las búsquedas en la API."""
+    if entry.get("isrc"):
+        uri = search_by_isrc(sp, entry["isrc"], queries)
         if uri:
-            return uri
+            return uri, TIER_ISRC, 1.0
+    if entry.get("upc"):
+        uri = search_by_upc(sp, entry["upc"], entry.get("track"), queries)
+        if uri:
+            return uri, TIER_UPC, 1.0
 
-    return None
+    best_uri, best_tier, best_score = None, None, 0.0
+    for tier, query in plan_queries(entry):
+        candidate, score = best_candidate(entry, search_candidates(sp, query, queries))
+        if candidate is None:
+            continue
+        if score >= MATCH_THRESHOLD:
+            return candidate[0], tier, round(score, 3)
+        if score > best_score:
+            best_uri, best_tier, best_score = candidate[0], tier, score
+    if best_score >= MATCH_MIN_SCORE:
+        return best_uri, best_tier, round(best_score, 3)
+    return None, None, 0.0
+
+def search_with_retry(sp: spotipy.Spotify, track_info: dict) -> str:
+    """
+    0. Si hay ISRC/UPC, busca por identificador exacto y termina si lo encuentra.
+    1. Busca por track + artist y puntúa los candidatos.
+    2. Si ninguno convence, prueba la búsqueda "avanzada".
+    3. Y por último solo el track.
+    Retorna el URI o None (ver resolve_track para conocer también el nivel y la confianza).
+    """
+    return resolve_track(sp, track_info)[0]
+
+def iter_resolved(sp: spotipy.Spotify, tracks_data: Iterable[dict], max_workers: int = None, known: dict = None,
+                  queries: QueryCoalescer = None):
+    """
+    Resuelve los tracks con resolve_track usando un pool de hilos.
+    tracks_data puede ser una lista o cualquier iterable (p. ej. el generador de
+    track_ingest.iter_tracks): se consume a medida que avanza la resolución,
+    con como mucho max_workers * _PENDING_PER_WORKER tracks pendientes.
+    Produce tuplas (track_info, uri, nivel, confianza) en el mismo orden de
+    entrada (uri y nivel son None si no se encontró). Emite un evento 'resolved'
+    o 'not_found' por track.
+    known ({índice: uri}) son tracks ya resueltos (p. ej. en un checkpoint):
+    no se vuelven a buscar.
+    queries es la memoria de consultas compartida; si no se indica se crea una
+    para esta llamada, de modo que cada consulta distinta sale a la red una vez.
+    """
+    workers = max(1, max_workers or DEFAULT_MAX_WORKERS)
+    known = known or {}
+    queries = queries if queries is not None else QueryCoalescer()
+
+    def resolve(index, track_info):
+        checkpointed = index in known
+        if checkpointed:
+            # La confianza de la resolución original no se guarda en el checkpoint
+            uri, tier, confidence = known[index], TIER_CHECKPOINT if known[index] else None, None
+        else:
+            with profile_section():
+                uri, tier, confidence = resolve_track(sp, track_info, queries)
+        tracker = _current_tracker.get()
+        if tracker is not None:
+            if uri:
+                tracker.track_done("resolved", index=index, uri=uri, tier=tier, confidence=confidence,
+                                   checkpointed=checkpointed)
+            else:
+                tracker.track_done("not_found", index=index, track=track_info.get("track"), checkpointed=checkpointed)
+        return uri, tier, confidence
+
+    if workers == 1:
+        for index, track_info in enumerate(tracks_data):
+            yield (track_info, *resolve(index, track_info))
+        return
+    window = workers * _PENDING_PER_WORKER
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Recoger en orden de envío conserva el orden de entrada
+        pending = deque()
+        for index, track_info in enumerate(tracks_data):
+            if index in known:
+                # Ya resuelto: no ocupa un hilo de búsqueda
+                future = Future()
+                future.set_result(resolve(index, track_info))
+            else:
+                # Cada tarea corre en una copia del contexto para conservar el tracker actual
+                future = executor.submit(contextvars.copy_context().run, resolve, index, track_info)
+            pending.append((track_info, future))
+            if len(pending) >= window:
+                track_info, future = pending.popleft()
+                yield (track_info, *future.result())
+        while pending:
+            track_info, future = pending.popleft()
+            yield (track_info, *future.result())
+
+# ==========================
+#   Resolución sin playlist
+# ==========================
+
+def resolve_tracks(
+    client_id: str,
+    client_secret: str,
+    tracks_data: Iterable[dict],
+    max_workers: int = None, # Búsquedas simultáneas (por defecto DEFAULT_MAX_WORKERS)
+    progress_callback=None, # Función que recibe cada evento de progreso (dict)
+    queries: QueryCoalescer = None # Memoria de consultas compartida con otras importaciones
+) -> dict:
+    """
+    Resuelve los tracks sin crear ni modificar ninguna playlist (dry-run), con
+    el mismo proceso que process_tracks: catálogo local, caché de búsquedas,
+    consultas compartidas y búsquedas en paralelo bajo el planificador.
+    Usa el token de la aplicación (client credentials): no hace falta que el
+    usuario inicie sesión ni se consulta su perfil.
+    Retorna {resolved_tracks, found_tracks_count, not_found_tracks,
+    low_confidence_tracks, match_tiers}. resolved_tracks tiene un elemento por
+    track de entrada, en el mismo orden: sus campos más uri, tier y confidence
+    (uri y tier son None si no se encontró). Es un manifiesto reutilizable:
+    pasarlo a process_tracks añade esos URIs sin volver a buscarlos.
+    Los errores se retornan como {error: mensaje}.
+    """
+    total = len(tracks_data) if hasattr(tracks_data, "__len__") else None
+    tracker = ProgressTracker(total=total, callback=progress_callback)
+    token = _current_tracker.set(tracker)
+    try:
+        tracker.emit("started")
+        with get_metrics().timer("import_stage_seconds", stage="resolve"):
+            result = _run_resolve(client_id, client_secret, tracks_data, max_workers, queries)
+        if "error" in result:
+            tracker.emit("failed", error=result["error"])
+        else:
+            tracker.emit("finished", found_tracks_count=result["found_tracks_count"],
+                         not_found_count=len(result["not_found_tracks"]))
+        return result
+    finally:
+        _current_tracker.reset(token)
+
+def _run_resolve(client_id, client_secret, tracks_data, max_workers, queries=None) -> dict:
+    """Cuerpo de resolve_tracks; los eventos se emiten en el tracker del contexto actual."""
+    clients = get_client_pool()
+    try:
+        sp = clients.get_app(client_id, client_secret).sp
+        # Pedir el token ahora: unas credenciales inválidas fallan antes de leer la entrada
+        sp.auth_manager.get_access_token(as_dict=False)
+    except Exception as e:
+        clients.discard(client_id, client_secret, None)
+        return {"error": f"Error de autenticación con Spotify: {e}"}
+
+    if not hasattr(tracks_data, "__len__"):
+        tracks_data = _timed_parse(tracks_data)
+
+    resolved_tracks = []
+    not_found_tracks = []
+    match_tiers = {}
+    low_confidence_tracks = []
+    try:
+        for track_info, uri, tier, confidence in iter_resolved(sp, _validated_tracks(tracks_data, {}),
+                                                              max_workers, queries=queries):
+            resolved_tracks.append({**track_info.to_dict(), "uri": uri, "tier": tier, "confidence": confidence})
+            if uri:
+                match_tiers[tier] = match_tiers.get(tier, 0) + 1
+                if confidence < MATCH_THRESHOLD:
+                    low_confidence_tracks.append({
+                        "track": track_info.get("track", "N/A"),
+                        "artist": track_info.get("artist", "N/A"),
+                        "uri": uri,
+                        "confidence": confidence
+                    })
+            else:
+                not_found_tracks.append(track_info.summary())
+    except spotipy.exceptions.SpotifyException as se:
+        if se.http_status == 401:
+            clients.discard(client_id, client_secret, None)
+        return {"error": f"Error de Spotify buscando tracks ({se.http_status}): {se.msg}"}
+    except requests.RequestException as ce:
+        return {"error": f"Error de conexión con Spotify buscando tracks: {ce}"}
+    except ValueError as ve:
+        return {"error": f"Error en el contenido JSON de los tracks: {ve}"}
+    finally:
+        catalog = get_catalog()
+        if catalog is not None:
+            catalog.flush()
+
+    return {
+        "resolved_tracks": resolved_tracks,
+        "found_tracks_count": len(resolved_tracks) - len(not_found_tracks),
+        "not_found_tracks": not_found_tracks,
+        "match_tiers": match_tiers,
+        "low_confidence_tracks": low_confidence_tracks
+    }
+
+# ==========================
+#   Contenido de playlists
+# ==========================
+
+# Spotify devuelve como máximo 100 items por página de playlist_items
+PLAYLIST_PAGE_SIZE = 100
+
+def fetch_playlist_uris(sp: spotipy.Spotify, playlist_id: str, snapshot_id: str = None,
+                        total: int = None, max_workers: int = None) -> list:
+    """
+    Retorna la lista ordenada de URIs de la playlist (None en las posiciones sin URI).
+    Si el índice de playlists tiene una entrada con el mismo snapshot_id se reutiliza
+    sin llamar a la API. Si no, se descargan todas las páginas en paralelo (si no se
+    conoce el total, primero se pide la primera página para obtenerlo).
+    """
+    index = get_playlist_index()
+    if index is not None and snapshot_id:
+        cached = index.get(playlist_id, snapshot_id)
+        if cached is not None:
+            _emit("existing_cached", playlist_id=playlist_id, snapshot_id=snapshot_id, count=len(cached))
+            return cached
+
+    def fetch_page(offset):
+        return _scheduler.call(sp.playlist_items, playlist_id,
+                               fields='items(track(uri)),total',
+                               additional_types=['track'],
+                               offset=offset, limit=PLAYLIST_PAGE_SIZE)
+
+    pages = {}
+    if total is None:
+        pages[0] = fetch_page(0)
+        total = pages[0].get('total') or 0
+    offsets = [offset for offset in range(0, total, PLAYLIST_PAGE_SIZE) if offset not in pages]
+    if offsets:
+        workers = min(len(offsets), max(1, max_workers or DEFAULT_MAX_WORKERS))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pages.update(zip(offsets, executor.map(fetch_page, offsets)))
+
+    uris = []
+    for offset in sorted(pages):
+        for item in pages[offset].get('items', []):
+            track = item.get('track') if item else None
+            uris.append(track.get('uri') if track else None)
+
+    if index is not None and snapshot_id:
+        # Solo se guarda si la playlist no cambió mientras se descargaban las páginas
+        current = _scheduler.call(sp.playlist, playlist_id, fields='snapshot_id')
+        if current and current.get('snapshot_id') == snapshot_id:
+            index.put(playlist_id, snapshot_id, uris)
+    return uris
+
+# Máximo de URIs por petición de escritura (añadir o quitar)
+PLAYLIST_WRITE_BATCH = 100
+
+def plan_playlist_sync(current: list, target: list) -> tuple:
+    """
+    Calcula las escrituras mínimas para que una playlist con el contenido
+    current (lista ordenada de URIs, p. ej. de fetch_playlist_uris) quede
+    exactamente como target. Retorna (operaciones, contenido final):
+    - {"op": "remove", "uris": [...]}: quita todas las apariciones de esos URIs
+      (los que sobran; si un URI aparece más veces de las que pide target se
+      quitan todas y las que faltan se insertan).
+    - {"op": "move", "range_start", "insert_before", "range_length"}: mueve un
+      bloque (posiciones del contenido antes de mover, como en la API).
+    - {"op": "insert", "position", "uris": [...]}: inserta URIs en esa posición.
+    Se conservan sin mover los elementos de la subsecuencia creciente más larga
+    (en el orden de target) de los que ya están; el resto se mueven, en bloques
+    si quedan seguidos. Las escrituras son proporcionales al cambio, no al
+    tamaño de la playlist. Los elementos que no son tracks de Spotify (archivos
+    locales, episodios o sin URI) no se tocan.
+    """
+    def is_track(uri):
+        return isinstance(uri, str) and uri.startswith("spotify:track:")
+
+    wanted = Counter(target)
+    present = Counter(uri for uri in current if is_track(uri))
+    removed = list(dict.fromkeys(uri for uri in current if is_track(uri) and present[uri] > wanted[uri]))
+    operations = [{"op": "remove", "uris": removed[i:i + PLAYLIST_WRITE_BATCH]}
+                  for i in range(0, len(removed), PLAYLIST_WRITE_BATCH)]
+    dropped = set(removed)
+
+    # Contenido tras quitar: cada track se identifica por la posición que ocupa en
+    # target (la k-ésima aparición de un URI es la k-ésima de target); los demás
+    # elementos conservan su URI
+    slots = defaultdict(deque)
+    for position, uri in enumerate(target):
+        slots[uri].append(position)
+    order = [slots[uri].popleft() if is_track(uri) else uri for uri in current if uri not in dropped]
+    kept = {slot for slot in order if isinstance(slot, int)}
+    staying = _longest_increasing([slot for slot in order if isinstance(slot, int)])
+
+    # Cada elemento que no se queda se coloca justo después del anterior de target
+    position = 0
+    while position < len(target):
+        if position in staying:
+            position += 1
+            continue
+        insert_before = order.index(position - 1) + 1 if position else 0
+        length = 1
+        if position in kept:
+            range_start = order.index(position)
+            while (position + length < len(target) and position + length not in staying
+                   and range_start + length < len(order) and order[range_start + length] == position + length):
+                length += 1
+            if range_start != insert_before:
+                operations.append({"op": "move", "range_start": range_start,
+                                   "insert_before": insert_before, "range_length": length})
+                block = order[range_start:range_start + length]
+                del order[range_start:range_start + length]
+                at = insert_before if insert_before < range_start else insert_before - length
+                order[at:at] = block
+        else:
+            while (position + length < len(target) and position + length not in kept
+                   and length < PLAYLIST_WRITE_BATCH):
+                length += 1
+            operations.append({"op": "insert", "position": insert_before,
+                               "uris": target[position:position + length]})
+            order[insert_before:insert_before] = range(position, position + length)
+        position += length
+    return operations, [target[slot] if isinstance(slot, int) else slot for slot in order]
+
+def _longest_increasing(values: list) -> set:
+    """Retorna los valores de una subsecuencia creciente más larga de values (enteros distintos)."""
+    tails, previous = [], {}
+    for value in values:
+        length = bisect.bisect_left(tails, value)
+        previous[value] = tails[length - 1] if length else None
+        if length == len(tails):
+            tails.append(value)
+        else:
+            tails[length] = value
+    result = set()
+    value = tails[-1] if tails else None
+    while value is not None:
+        result.add(value)
+        value = previous[value]
+    return result
 
 # ==========================
 #  Función principal adaptada
@@ -80,84 +758,334 @@ def process_tracks(
     client_id: str,
     client_secret: str,
     redirect_uri: str,
-    tracks_data: list[dict],
+    tracks_data: Iterable[dict],
     playlist_name: str,
     playlist_url: str = None,
-    duplicate_option: str = 'add_all', # Opciones: 'add_all', 'add_new'
-    playlist_description: str = None # Nueva descripción personalizada
+    duplicate_option: str = 'add_all', # Opciones: 'add_all', 'add_new', 'sync'
+    playlist_description: str = None, # Nueva descripción personalizada
+    max_workers: int = None, # Búsquedas simultáneas (por defecto DEFAULT_MAX_WORKERS)
+    progress_callback=None, # Función que recibe cada evento de progreso (dict)
+    checkpoint_id: str = None, # Guarda/reanuda el avance de la importación con este ID
+    queries: QueryCoalescer = None, # Memoria de consultas compartida con otras importaciones
+    pipelined: bool = None # Añade los lotes mientras se busca (por defecto PIPELINED_IMPORT)
 ) -> dict:
     """
     Procesa una lista de tracks, los busca en Spotify y los añade a una playlist.
+    tracks_data puede ser una lista o un generador (ver track_ingest.iter_tracks);
+    en ese caso las búsquedas empiezan mientras la entrada aún se está leyendo.
+    Cada track se valida y se guarda como TrackRecord (ver track_ingest); un
+    elemento inválido termina la importación con error.
     Si se proporciona playlist_url, añade a esa playlist existente.
     Si no, crea una nueva playlist con playlist_name.
     duplicate_option controla si se añaden tracks ya existentes ('add_all') o solo nuevos ('add_new').
+    Con 'sync' la playlist existente queda exactamente como la lista (mismos tracks,
+    repeticiones y orden) con las escrituras mínimas: quita los que sobran, mueve
+    los que están fuera de orden e inserta los que faltan (ver plan_playlist_sync).
+    Siempre se ejecuta sin pipelined y el resultado incluye sync_changes.
+    max_workers limita cuántos tracks se buscan en paralelo.
+    progress_callback, si se indica, recibe los eventos de progreso (ver ProgressTracker):
+    started, resolved, not_found, batch_added, finished, failed, etc.
+    checkpoint_id activa el modo reanudable: los tracks resueltos, la playlist
+    destino y los lotes añadidos se guardan en el almacén de checkpoints, y una
+    nueva llamada con el mismo ID y la misma lista continúa desde el último lote
+    confirmado sin repetir búsquedas ni añadir dos veces un lote.
+    queries permite compartir la memoria de consultas entre varias importaciones
+    (p. ej. un lote de playlists en main.py); por defecto cada importación usa la suya.
+    pipelined prepara la playlist antes de empezar a buscar y añade cada lote
+    completo de 100 URIs mientras la resolución continúa, de modo que en listas
+    largas el tiempo total se acerca al máximo de búsqueda y escritura en lugar
+    de a su suma. El orden final es el de la entrada.
     Retorna un diccionario con los resultados: {found_uris: [], not_found_tracks: [], playlist_url: str}.
+    match_tiers cuenta los tracks encontrados por cada nivel de búsqueda (isrc, upc,
+    advanced, track_artist, track, catalog, uri o checkpoint) y low_confidence_tracks lista los que
+    se añadieron con una coincidencia por debajo de MATCH_THRESHOLD (con su confianza).
     """
+    total = len(tracks_data) if hasattr(tracks_data, "__len__") else None
+    tracker = ProgressTracker(total=total, callback=progress_callback)
+    token = _current_tracker.set(tracker)
     try:
-        sp = spotipy.Spotify(
-            auth_manager=SpotifyOAuth(
-                client_id=client_id,
-                client_secret=client_secret,
-                redirect_uri=redirect_uri,
-                scope="playlist-modify-public playlist-modify-private"
+        tracker.emit("started")
+        checkpoint = get_checkpoint_store().open(checkpoint_id) if checkpoint_id else None
+        with get_metrics().timer("import_stage_seconds", stage="import"):
+            result = _run_import(
+                client_id, client_secret, redirect_uri, tracks_data, playlist_name,
+                playlist_url, duplicate_option, playlist_description, max_workers, checkpoint, queries,
+                PIPELINED_IMPORT if pipelined is None else pipelined
             )
-        )
-        user_id = sp.current_user()["id"]
+        if "error" in result:
+            tracker.emit("failed", error=result["error"])
+        else:
+            tracker.emit("finished", found_tracks_count=result["found_tracks_count"],
+                         not_found_count=len(result["not_found_tracks"]), playlist_url=result["playlist_url"])
+        return result
+    finally:
+        _current_tracker.reset(token)
+
+def _run_import(client_id, client_secret, redirect_uri, tracks_data, playlist_name,
+                playlist_url, duplicate_option, playlist_description, max_workers, checkpoint, queries=None,
+                pipelined=False) -> dict:
+    """Cuerpo de process_tracks; los eventos se emiten en el tracker del contexto actual."""
+    # Cliente, token e ID de usuario se reutilizan entre importaciones
+    clients = get_client_pool()
+    try:
+        client = clients.get(client_id, client_secret, redirect_uri)
+        sp = client.sp
+        user_id = client.user_id()
     except Exception as e:
+        clients.discard(client_id, client_secret, redirect_uri)
         return {"error": f"Error de autenticación con Spotify: {e}"}
 
     found_track_uris = []
     not_found_tracks = []
-    existing_track_uris = set() # Para guardar URIs existentes si es necesario
+    match_tiers = {} # Tracks encontrados por cada nivel de búsqueda
+    low_confidence_tracks = [] # Encontrados sin superar MATCH_THRESHOLD
 
-    for track_info in tracks_data:
-        uri = search_with_retry(sp, track_info)
-        if uri:
-            found_track_uris.append(uri)
+    # Avance guardado de una ejecución anterior (modo reanudable)
+    resolutions = checkpoint.load_resolutions() if checkpoint else {}
+    plan = checkpoint.load_plan() if checkpoint else None
+    # Al reanudar se mantiene el modo con el que empezó la importación
+    if plan is not None:
+        pipelined = plan["pipelined"]
+    # Sincronizar necesita la lista completa antes de escribir
+    sync = bool(playlist_url) and duplicate_option == 'sync'
+    if sync:
+        pipelined = False
+
+    # Modo pipelined: la playlist se prepara antes de buscar y cada lote completo
+    # se añade mientras la resolución continúa
+    adder = None
+    uris_to_add = []
+    if pipelined:
+        if plan is not None:
+            target = {"playlist_id": plan["playlist_id"], "playlist_url": plan["playlist_url"],
+                      "existing_uris": plan["existing_uris"]}
+            _emit("resumed", f"Reanudando la importación en la playlist {target['playlist_id']}...",
+                  playlist_id=target["playlist_id"])
         else:
-            # Guardamos la info original para mostrarla al usuario
-            not_found_tracks.append({
-                "track": track_info.get("track", "N/A"),
-                "artist": track_info.get("artist", "N/A"),
-                "album": track_info.get("album", "N/A")
-            })
+            target = _prepare_playlist(sp, user_id, playlist_url, playlist_name, playlist_description, duplicate_option)
+            if "error" in target:
+                return target
+            if checkpoint:
+                checkpoint.save_plan(target["playlist_id"], target["playlist_url"], [], 0,
+                                     pipelined=True, existing_uris=target["existing_uris"])
+        _emit("playlist_ready", playlist_id=target["playlist_id"], playlist_url=target["playlist_url"])
+        # Con 'add_new' se descartan al vuelo los URIs ya presentes o ya encolados
+        seen_uris = set(target["existing_uris"]) if playlist_url and duplicate_option == 'add_new' else None
+        adder = _BatchAdder(sp, target["playlist_id"], checkpoint)
+        adder.start()
+
+    if not hasattr(tracks_data, "__len__"):
+        # Entrada incremental: se mide el tiempo de lectura y decodificación
+        tracks_data = _timed_parse(tracks_data)
+
+    tracks_count = 0
+    # Solo si la resolución termina sin errores se envía el último lote incompleto:
+    # uno enviado a medias quedaría confirmado con su índice y al reanudar se saltaría entero
+    completed = False
+    try:
+        resolved = iter_resolved(sp, _validated_tracks(tracks_data, resolutions), max_workers,
+                                 known={index: uri for index, (uri, _) in resolutions.items()}, queries=queries)
+        for index, (track_info, uri, tier, confidence) in enumerate(resolved):
+            tracks_count = index + 1
+            if checkpoint and index not in resolutions:
+                checkpoint.record_resolution(index, uri, track_info)
+            if uri:
+                found_track_uris.append(uri)
+                match_tiers[tier] = match_tiers.get(tier, 0) + 1
+                if confidence is not None and confidence < MATCH_THRESHOLD:
+                    low_confidence_tracks.append({
+                        "track": track_info.get("track", "N/A"),
+                        "artist": track_info.get("artist", "N/A"),
+                        "uri": uri,
+                        "confidence": confidence
+                    })
+                if adder is not None and (seen_uris is None or uri not in seen_uris):
+                    if seen_uris is not None:
+                        seen_uris.add(uri)
+                    uris_to_add.append(uri)
+                    if len(uris_to_add) % 100 == 0:
+                        adder.submit(uris_to_add[-100:])
+            else:
+                # Guardamos la info original para mostrarla al usuario
+                not_found_tracks.append(track_info.summary())
+            if adder is not None and adder.error:
+                # Un lote falló: no tiene sentido seguir buscando
+                break
+        completed = True
+    except spotipy.exceptions.SpotifyException as se:
+        if se.http_status == 401:
+            # Token revocado o inválido: el siguiente intento crea un cliente nuevo
+            clients.discard(client_id, client_secret, redirect_uri)
+        return {"error": f"Error de Spotify buscando tracks ({se.http_status}): {se.msg}"}
+    except requests.RequestException as ce:
+        # Errores de conexión o timeouts que siguen fallando tras los reintentos del planificador
+        return {"error": f"Error de conexión con Spotify buscando tracks: {ce}"}
+    except CheckpointMismatch as cm:
+        return {"error": str(cm)}
+    except ValueError as ve:
+        # Errores de formato detectados al leer una entrada incremental
+        return {"error": f"Error en el contenido JSON de los tracks: {ve}"}
+    finally:
+        if checkpoint:
+            checkpoint.flush()
+        catalog = get_catalog()
+        if catalog is not None:
+            catalog.flush()
+        if adder is not None:
+            # Enviar el último lote incompleto (solo si la resolución terminó sin
+            # errores) y esperar a que terminen los pendientes
+            if completed and uris_to_add and len(uris_to_add) % 100 and not adder.error:
+                adder.submit(uris_to_add[-(len(uris_to_add) % 100):])
+            added = adder.close()
+
+    if adder is not None:
+        if "error" in added:
+            return added
+        target_playlist_id = target["playlist_id"]
+        final_playlist_url = target["playlist_url"]
+        if seen_uris is not None:
+            _emit("filtered", f"Filtrando URIs. Original: {len(found_track_uris)}, A añadir: {len(uris_to_add)}",
+                  found=len(found_track_uris), to_add=len(uris_to_add))
+    elif plan is not None and not sync:
+        # Reanudación: la playlist destino y los URIs a añadir ya se decidieron
+        # (una sincronización se vuelve a calcular sobre el contenido actual)
+        if plan["tracks_count"] != tracks_count:
+            return {"error": "La lista de tracks no coincide con la importación que se está reanudando."}
+        target_playlist_id = plan["playlist_id"]
+        final_playlist_url = plan["playlist_url"]
+        uris_to_add = plan["uris"]
+        _emit("resumed", f"Reanudando la importación en la playlist {target_playlist_id}...",
+              playlist_id=target_playlist_id)
+    else:
+        target = _prepare_playlist(sp, user_id, playlist_url, playlist_name, playlist_description, duplicate_option)
+        if "error" in target:
+            return target
+        target_playlist_id = target["playlist_id"]
+        final_playlist_url = target["playlist_url"]
+
+        # Filtrar URIs si es necesario (opción 'add_new'): ni los que ya están en la
+        # playlist ni los repetidos dentro de la propia lista
+        uris_to_add = found_track_uris
+        if playlist_url and duplicate_option == 'add_new':
+            existing_track_uris = set(target["existing_uris"])
+            uris_to_add = list(dict.fromkeys(uri for uri in found_track_uris if uri not in existing_track_uris))
+            _emit("filtered", f"Filtrando URIs. Original: {len(found_track_uris)}, A añadir: {len(uris_to_add)}",
+                  found=len(found_track_uris), to_add=len(uris_to_add))
+        if checkpoint:
+            checkpoint.save_plan(target_playlist_id, final_playlist_url, uris_to_add, tracks_count)
+
+    if adder is None:
+        _emit("playlist_ready", playlist_id=target_playlist_id, playlist_url=final_playlist_url)
+
+        # Agregar tracks a la playlist (nueva o existente), o sincronizarla con la lista
+        added = {"snapshot_id": None}
+        if sync:
+            added = _sync_playlist(sp, target_playlist_id, target["snapshot_id"], target["existing_uris"], uris_to_add)
+            if "error" in added:
+                return added
+        elif uris_to_add and target_playlist_id:
+            added = _add_batches(sp, target_playlist_id, uris_to_add, checkpoint)
+            if "error" in added:
+                return added
+
+    index = get_playlist_index()
+    if ((plan is None or pipelined) and duplicate_option == 'add_new' and playlist_url
+            and index is not None and added["snapshot_id"]):
+        # El contenido tras añadir es conocido: se indexa con el nuevo snapshot para la próxima importación
+        index.put(target_playlist_id, added["snapshot_id"], target["existing_uris"] + uris_to_add)
+    elif sync and index is not None and added["snapshot_id"]:
+        index.put(target_playlist_id, added["snapshot_id"], added["uris"])
+
+    # Actualizar el contador de tracks encontrados basado en lo que realmente se intentó añadir
+    final_added_count = len(uris_to_add)
+
+    result = {
+        "found_tracks_count": final_added_count, # Ahora refleja los tracks realmente añadidos
+        "not_found_tracks": not_found_tracks,
+        "match_tiers": match_tiers,
+        "low_confidence_tracks": low_confidence_tracks,
+        "playlist_url": final_playlist_url
+    }
+    if sync:
+        # Escrituras hechas para sincronizar: removed, moved, inserted y writes
+        result["sync_changes"] = added["changes"]
+    return result
+
+def _timed_parse(tracks_data: Iterable[dict]):
+    """
+    Produce los tracks de una entrada incremental y registra en import_stage_seconds
+    (stage="parse") el tiempo total dedicado a leerlos y decodificarlos.
+    """
+    iterator = iter(tracks_data)
+    elapsed = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                track_info = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            yield track_info
+    finally:
+        get_metrics().observe("import_stage_seconds", elapsed, stage="parse")
 
-    target_playlist_id = None
-    final_playlist_url = None
+def _validated_tracks(tracks_data: Iterable[dict], resolutions: dict):
+    """
+    Produce los tracks de entrada como TrackRecord (lanza ValueError si alguno
+    no es válido) comprobando que coinciden con los guardados en el checkpoint:
+    reanudar con una lista distinta reutilizaría URIs equivocados.
+    """
+    for index, track_info in enumerate(tracks_data):
+        track_info = TrackRecord.from_dict(track_info, index)
+        saved = resolutions.get(index)
+        if saved is not None:
+            _, summary = saved
+            if (summary["track"] != track_info.get("track", "N/A")
+                    or summary["artist"] != track_info.get("artist", "N/A")):
+                raise CheckpointMismatch(f"El track {index} no coincide con la importación que se está reanudando.")
+        yield track_info
 
+def _prepare_playlist(sp: spotipy.Spotify, user_id: str, playlist_url: str, playlist_name: str,
+                      playlist_description: str, duplicate_option: str) -> dict:
+    """
+    Obtiene la playlist destino: valida la existente (playlist_url) o crea una nueva.
+    Con duplicate_option='add_new' o 'sync' obtiene también los URIs que ya contiene
+    (existing_uris, lista ordenada), reutilizando el índice de playlists si el
+    snapshot no ha cambiado.
+    Retorna {playlist_id, playlist_url, snapshot_id, existing_uris} o {error}.
+    """
+    existing_track_uris = [] # Para guardar URIs existentes si es necesario
     if playlist_url:
         try:
             # Extraer ID de la URL
             playlist_id = playlist_url.split('/')[-1].split('?')[0]
             # Verificar si la playlist existe
-            playlist_details = sp.playlist(playlist_id, fields='id,external_urls.spotify')
-            if playlist_details:
-                 target_playlist_id = playlist_id
-                 final_playlist_url = playlist_details["external_urls"]["spotify"]
-
-                 # Si la opción es añadir solo nuevos, obtener tracks existentes
-                 if duplicate_option == 'add_new':
-                     print(f"Opción 'add_new' seleccionada. Obteniendo tracks existentes de la playlist {target_playlist_id}...")
-                     offset = 0
-                     while True:
-                         results = sp.playlist_items(target_playlist_id,
-                                                     fields='items(track(uri)),next',
-                                                     additional_types=['track'],
-                                                     offset=offset)
-                         items = results.get('items', [])
-                         if not items:
-                             break
-                         for item in items:
-                             if item and item.get('track') and item['track'].get('uri'):
-                                 existing_track_uris.add(item['track']['uri'])
-                         if results.get('next'):
-                             offset += len(items)
-                         else:
-                             break
-                     print(f"Se encontraron {len(existing_track_uris)} tracks existentes en la playlist.")
-
-            else:
+            playlist_details = _scheduler.call(sp.playlist, playlist_id,
+                                               fields='id,external_urls.spotify,snapshot_id,tracks.total')
+            if not playlist_details:
                 return {"error": f"No se encontró o no se tiene acceso a la playlist: {playlist_url}"}
+
+            # Si la opción es añadir solo nuevos o sincronizar, obtener tracks existentes
+            if duplicate_option in ('add_new', 'sync'):
+                _emit("fetching_existing", f"Opción '{duplicate_option}' seleccionada. Obteniendo tracks existentes de la playlist {playlist_id}...",
+                      playlist_id=playlist_id)
+                with get_metrics().timer("import_stage_seconds", stage="playlist_fetch"):
+                    existing_track_uris = fetch_playlist_uris(
+                        sp, playlist_id,
+                        snapshot_id=playlist_details.get("snapshot_id"),
+                        total=(playlist_details.get("tracks") or {}).get("total")
+                    )
+                _emit("existing_tracks", f"Se encontraron {len(existing_track_uris)} tracks existentes en la playlist.",
+                      count=len(existing_track_uris))
+
+            return {
+                "playlist_id": playlist_id,
+                "playlist_url": playlist_details["external_urls"]["spotify"],
+                "snapshot_id": playlist_details.get("snapshot_id"),
+                "existing_uris": existing_track_uris
+            }
         except spotipy.exceptions.SpotifyException as se:
             if se.http_status == 404:
                  return {"error": f"Playlist no encontrada: {playlist_url}"}
@@ -165,44 +1093,183 @@ def process_tracks(
                  return {"error": f"Error de Spotify al obtener playlist ({se.http_status}): {se.msg}"}
         except Exception as e:
             return {"error": f"Error al procesar URL de playlist existente: {e}"}
-    else:
-        # Crear nueva playlist
-        try:
-            description_to_use = playlist_description if playlist_description else "Playlist creada desde JSON vía web"
-            new_playlist = sp.user_playlist_create(
-                user=user_id,
-                name=playlist_name,
-                public=True,
-                description=description_to_use # Usar descripción
-            )
-            target_playlist_id = new_playlist["id"]
-            final_playlist_url = new_playlist["external_urls"]["spotify"]
-        except Exception as e:
-            return {"error": f"Error creando la nueva playlist: {e}"}
 
-    # Filtrar URIs si es necesario (opción 'add_new')
-    uris_to_add = found_track_uris
-    if playlist_url and duplicate_option == 'add_new':
-        uris_to_add = [uri for uri in found_track_uris if uri not in existing_track_uris]
-        print(f"Filtrando URIs. Original: {len(found_track_uris)}, A añadir: {len(uris_to_add)}")
+    # Crear nueva playlist
+    try:
+        description_to_use = playlist_description if playlist_description else "Playlist creada desde JSON vía web"
+        new_playlist = _scheduler.call(
+            sp.user_playlist_create,
+            idempotent=False,
+            user=user_id,
+            name=playlist_name,
+            public=True,
+            description=description_to_use # Usar descripción
+        )
+        return {
+            "playlist_id": new_playlist["id"],
+            "playlist_url": new_playlist["external_urls"]["spotify"],
+            "snapshot_id": new_playlist.get("snapshot_id"),
+            "existing_uris": existing_track_uris
+        }
+    except Exception as e:
+        return {"error": f"Error creando la nueva playlist: {e}"}
 
-    # Agregar tracks a la playlist (nueva o existente)
-    if uris_to_add and target_playlist_id:
-        print(f"Añadiendo {len(uris_to_add)} tracks a la playlist {target_playlist_id}...")
-        try:
-            # Spotify permite añadir 100 items por llamada
-            for i in range(0, len(uris_to_add), 100):
-                batch = uris_to_add[i:i+100]
-                sp.playlist_add_items(target_playlist_id, batch)
-                print(f"  ...añadido lote de {len(batch)} tracks.")
-        except Exception as e:
-             return {"error": f"Error añadiendo tracks a la playlist {target_playlist_id}: {e}"}
+def _add_batches(sp: spotipy.Spotify, playlist_id: str, uris_to_add: list, checkpoint=None) -> dict:
+    """
+    Añade los URIs a la playlist en lotes de 100 (máximo de Spotify por llamada).
+    Con checkpoint, salta los lotes ya confirmados y registra cada lote añadido.
+    Retorna {snapshot_id} (el de la playlist tras el último lote añadido, o None
+    si no se añadió ninguno) o {error} si falló algún lote.
+    """
+    snapshot_id = None
+    committed = checkpoint.committed_batches() if checkpoint else set()
+    _emit("adding", f"Añadiendo {len(uris_to_add)} tracks a la playlist {playlist_id}...",
+          playlist_id=playlist_id, count=len(uris_to_add))
+    try:
+        for batch_index, i in enumerate(range(0, len(uris_to_add), 100)):
+            batch = uris_to_add[i:i+100]
+            if batch_index in committed:
+                _emit("batch_skipped", batch_index=batch_index, batch_size=len(batch))
+                continue
+            with get_metrics().timer("import_stage_seconds", stage="add_batch"):
+                response = _scheduler.call(sp.playlist_add_items, playlist_id, batch, idempotent=False)
+            snapshot_id = (response or {}).get("snapshot_id")
+            if checkpoint:
+                checkpoint.commit_batch(batch_index)
+            _emit("batch_added", f"  ...añadido lote de {len(batch)} tracks.",
+                  batch_index=batch_index, batch_size=len(batch), added=i + len(batch), to_add=len(uris_to_add))
+    except Exception as e:
+         return {"error": f"Error añadiendo tracks a la playlist {playlist_id}: {e}"}
+    return {"snapshot_id": snapshot_id}
 
-    # Actualizar el contador de tracks encontrados basado en lo que realmente se intentó añadir
-    final_added_count = len(uris_to_add)
+def _sync_playlist(sp: spotipy.Spotify, playlist_id: str, snapshot_id: str, current: list, target: list) -> dict:
+    """
+    Deja la playlist (con contenido current en la versión snapshot_id) exactamente
+    como target aplicando las escrituras de plan_playlist_sync. Cada escritura
+    de quitar o mover lleva el snapshot_id de la versión sobre la que se
+    calcularon sus posiciones (el de la respuesta anterior), de modo que Spotify
+    las aplica sobre esa versión aunque la playlist haya cambiado entretanto.
+    Retorna {snapshot_id, uris (contenido final), changes} o {error}.
+    """
+    operations, contents = plan_playlist_sync(current, target)
+    removed = {uri for op in operations if op["op"] == "remove" for uri in op["uris"]}
+    changes = {
+        "removed": sum(1 for uri in current if uri in removed),
+        "moved": sum(op["range_length"] for op in operations if op["op"] == "move"),
+        "inserted": sum(len(op["uris"]) for op in operations if op["op"] == "insert"),
+        "writes": len(operations)
+    }
+    _emit("syncing", f"Sincronizando la playlist {playlist_id}: {changes['removed']} a quitar, "
+                     f"{changes['moved']} a mover y {changes['inserted']} a insertar ({changes['writes']} escrituras)...",
+          playlist_id=playlist_id, **changes)
+    try:
+        for write_index, op in enumerate(operations):
+            with get_metrics().timer("import_stage_seconds", stage="sync_write"):
+                if op["op"] == "remove":
+                    response = _scheduler.call(sp.playlist_remove_all_occurrences_of_items, playlist_id, op["uris"],
+                                               snapshot_id=snapshot_id, idempotent=False)
+                elif op["op"] == "move":
+                    response = _scheduler.call(sp.playlist_reorder_items, playlist_id, op["range_start"],
+                                               op["insert_before"], range_length=op["range_length"],
+                                               snapshot_id=snapshot_id, idempotent=False)
+                else:
+                    response = _scheduler.call(sp.playlist_add_items, playlist_id, op["uris"],
+                                               position=op["position"], idempotent=False)
+            snapshot_id = (response or {}).get("snapshot_id") or snapshot_id
+            _emit("sync_write", write_index=write_index, writes=len(operations), op=op["op"],
+                  size=op.get("range_length") or len(op["uris"]))
+    except Exception as e:
+        return {"error": f"Error sincronizando la playlist {playlist_id}: {e}"}
+    return {"snapshot_id": snapshot_id, "uris": contents, "changes": changes}
 
-    return {
-        "found_tracks_count": final_added_count, # Ahora refleja los tracks realmente añadidos
-        "not_found_tracks": not_found_tracks,
-        "playlist_url": final_playlist_url
-    } 
\ No newline at end of file
+# Lotes completos que pueden esperar en cola al hilo que los añade (modo pipelined);
+# si la escritura va más lenta que la búsqueda, la resolución espera.
+_ADDER_QUEUE_BATCHES = 4
+
+class _BatchAdder:
+    """
+    Añade lotes de URIs a una playlist desde un hilo propio mientras la
+    resolución continúa (modo pipelined). Un único hilo envía los lotes en el
+    orden en que llegan, así que la playlist conserva el orden de entrada.
+    Con checkpoint, salta los lotes ya confirmados y registra cada lote añadido.
+    Tras el primer error deja de añadir y descarta los lotes restantes; un error
+    inesperado del hilo (p. ej. del checkpoint) se relanza desde submit y close.
+    """
+
+    def __init__(self, sp: spotipy.Spotify, playlist_id: str, checkpoint=None):
+        self.sp = sp
+        self.playlist_id = playlist_id
+        self.checkpoint = checkpoint
+        self.committed = checkpoint.committed_batches() if checkpoint else set()
+        self.error = None
+        self.snapshot_id = None
+        self._failure = None
+        self._added = 0
+        self._submitted = 0
+        self._queue = queue.Queue(maxsize=_ADDER_QUEUE_BATCHES)
+        # El hilo corre en una copia del contexto para emitir en el tracker actual
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run,),
+                                        name="playlist-adder", daemon=True)
+
+    def start(self) -> None:
+        _emit("adding", f"Añadiendo tracks a la playlist {self.playlist_id} a medida que se encuentran...",
+              playlist_id=self.playlist_id, count=None)
+        self._thread.start()
+
+    def submit(self, batch: list) -> None:
+        """Encola un lote (como mucho 100 URIs); bloquea si la cola está llena."""
+        if self._failure is not None:
+            raise self._failure
+        self._queue.put((self._submitted, list(batch)))
+        self._submitted += 1
+
+    def close(self) -> dict:
+        """Espera a que se añadan los lotes encolados. Retorna {snapshot_id} o {error}."""
+        self._queue.put(None)
+        self._thread.join()
+        if self._failure is not None:
+            raise self._failure
+        if self.error:
+            return {"error": self.error}
+        return {"snapshot_id": self.snapshot_id}
+
+    def _run(self) -> None:
+        with profile_section():
+            self._add_queued()
+
+    def _add_queued(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self.error:
+                continue
+            try:
+                self._add_batch(*item)
+            except Exception as e:
+                # Se guarda para relanzarlo en el hilo de la importación; el hilo sigue
+                # vaciando la cola para que submit y close no se queden bloqueados
+                self._failure = e
+                self.error = f"Error inesperado añadiendo tracks a la playlist {self.playlist_id}: {e}"
+
+    def _add_batch(self, batch_index: int, batch: list) -> None:
+        """Añade un lote a la playlist (o lo salta si ya estaba confirmado)."""
+        if batch_index in self.committed:
+            self._added += len(batch)
+            _emit("batch_skipped", batch_index=batch_index, batch_size=len(batch))
+            return
+        try:
+            with get_metrics().timer("import_stage_seconds", stage="add_batch"):
+                response = _scheduler.call(self.sp.playlist_add_items, self.playlist_id, batch, idempotent=False)
+        except Exception as e:
+            self.error = f"Error añadiendo tracks a la playlist {self.playlist_id}: {e}"
+            return
+        self.snapshot_id = (response or {}).get("snapshot_id")
+        if self.checkpoint:
+            # Las resoluciones de los tracks del lote se persisten antes de
+            # confirmarlo: al reanudar no se repiten búsquedas ni se mueven los lotes
+            self.checkpoint.flush()
+            self.checkpoint.commit_batch(batch_index)
+        self._added += len(batch)
+        _emit("batch_added", f"  ...añadido lote de {len(batch)} tracks.",
+              batch_index=batch_index, batch_size=len(batch), added=self._added, to_add=None)
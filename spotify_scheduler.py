@@ -0,0 +1,184 @@
+import os
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from spotipy.exceptions import SpotifyException
+from metrics import get_metrics
+
+# ==========================
+#   Configuración del planificador
+# ==========================
+
+# Ritmo sostenido y ráfaga máxima de peticiones a la API de Spotify
+REQUESTS_PER_SECOND = float(os.getenv("SPOTIFY_REQUESTS_PER_SECOND", "10"))
+BURST_SIZE = int(os.getenv("SPOTIFY_BURST_SIZE", "20"))
+# Presupuesto global de peticiones en vuelo, compartido por todas las
+# importaciones del proceso.
+MAX_CONCURRENT_REQUESTS = int(os.getenv("SPOTIFY_MAX_CONCURRENT_REQUESTS", "10"))
+# Reintentos ante 429, errores 5xx o de conexión
+MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", "5"))
+BASE_BACKOFF = 0.5   # segundos
+MAX_BACKOFF = 30.0   # segundos
+
+# Códigos que se reintentan en llamadas idempotentes (las de escritura solo reintentan 429)
+_RETRYABLE_STATUS = {500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Cubo de fichas compartido entre hilos.
+    Cada petición consume una ficha; las fichas se reponen a `rate` por segundo
+    hasta `capacity`. pause() congela la salida de peticiones (p. ej. tras un 429).
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Bloquea hasta que haya una ficha disponible y la consume."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                    self._updated_at = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Detiene todas las peticiones durante `seconds` y vacía el cubo."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._updated_at = self._paused_until
+
+
+class RequestScheduler:
+    """
+    Punto único por el que pasan todas las llamadas a Spotify:
+    limita el ritmo con un TokenBucket, acota las peticiones en vuelo,
+    respeta Retry-After en las respuestas 429 y reintenta con backoff
+    exponencial con jitter.
+    Cada intento queda registrado en las métricas del proceso
+    (spotify_api_requests_total y spotify_api_request_seconds).
+    """
+
+    def __init__(self, rate: float = REQUESTS_PER_SECOND, burst: int = BURST_SIZE,
+                 max_concurrent: int = MAX_CONCURRENT_REQUESTS, max_retries: int = MAX_RETRIES):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self._in_flight = threading.BoundedSemaphore(max_concurrent)
+
+    def call(self, fn, *args, idempotent: bool = True, **kwargs):
+        """
+        Ejecuta fn(*args, **kwargs) respetando el límite de la API.
+        Las llamadas no idempotentes (añadir tracks, crear playlists) solo se
+        reintentan ante 429, ya que en ese caso Spotify no aplicó la petición.
+        Relanza la última excepción si se agotan los reintentos.
+        """
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                return self._send(fn, args, kwargs)
+            except SpotifyException as e:
+                if attempt >= self.max_retries:
+                    raise
+                if e.http_status == 429:
+                    delay = _retry_after(e) or _backoff(attempt)
+                    # Un 429 afecta a todo el proceso: pausamos el cubo compartido
+                    self.bucket.pause(delay)
+                    print(f"Límite de peticiones alcanzado (429). Esperando {delay:.1f}s antes de reintentar...")
+                elif idempotent and e.http_status in _RETRYABLE_STATUS:
+                    delay = _backoff(attempt)
+                    time.sleep(delay)
+                else:
+                    raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                time.sleep(_backoff(attempt))
+            attempt += 1
+
+    def _send(self, fn, args: tuple, kwargs: dict):
+        """Ejecuta un intento dentro del límite de peticiones en vuelo y registra su estado y duración."""
+        endpoint = getattr(fn, "__name__", "unknown")
+        status = "error"
+        with self._in_flight:
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+                status = "2xx"
+                return result
+            except SpotifyException as e:
+                status = str(e.http_status)
+                raise
+            except requests.exceptions.Timeout:
+                status = "timeout"
+                raise
+            except requests.exceptions.ConnectionError:
+                status = "connection_error"
+                raise
+            finally:
+                metrics = get_metrics()
+                metrics.inc("spotify_api_requests_total", endpoint=endpoint, status=status)
+                metrics.observe("spotify_api_request_seconds", time.perf_counter() - started, endpoint=endpoint)
+
+
+def _retry_after(error: SpotifyException) -> float:
+    """Extrae la cabecera Retry-After (en segundos) de una respuesta 429, si existe."""
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    """Backoff exponencial con jitter completo."""
+    return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * (2 ** attempt)))
+
+
+# ==========================
+#   Instancias compartidas
+# ==========================
+
+_scheduler = RequestScheduler()
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """Retorna el planificador compartido del proceso."""
+    return _scheduler
+
+
+def get_http_session() -> requests.Session:
+    """
+    Retorna la sesión HTTP compartida del proceso, con un pool de conexiones
+    dimensionado para las peticiones en vuelo. No reintenta por sí misma:
+    los reintentos los gestiona RequestScheduler.
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONCURRENT_REQUESTS, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
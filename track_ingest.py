@@ -0,0 +1,235 @@
+import re
+import sys
+import json
+import codecs
+
+# ==========================
+#   Lectura incremental de tracks
+# ==========================
+
+# Tamaño de cada lectura del stream de entrada
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\r\n"
+_decoder = json.JSONDecoder()
+# Un valor cortado al final del búfer falla como mucho a estos caracteres del
+# final (el literal o número incompleto más largo, p. ej. "-Infinit"); un error
+# anterior es de sintaxis y no se arregla leyendo más
+_TRUNCATION_MARGIN = 16
+
+
+def iter_tracks(stream, chunk_size: int = CHUNK_SIZE):
+    """
+    Lee tracks de un stream (binario o de texto) de forma incremental y los
+    produce uno a uno a medida que se van leyendo.
+    Acepta un array JSON ([{...}, {...}]) o NDJSON (un objeto por línea).
+    Cada track se produce como TrackRecord.
+    La memoria usada no depende del tamaño total de la entrada.
+    Lanza ValueError (o json.JSONDecodeError) si el contenido no es válido.
+    """
+    for index, value in enumerate(iter_json_objects(stream, chunk_size)):
+        yield TrackRecord.from_dict(value, index)
+
+
+def iter_json_objects(stream, chunk_size: int = CHUNK_SIZE):
+    """
+    Lee de forma incremental un array JSON o NDJSON y produce cada elemento
+    tal cual (sin validarlo como track). Ver iter_tracks.
+    """
+    reader = _ChunkReader(stream, chunk_size)
+    reader.skip_whitespace()
+    in_array = reader.peek() == "["
+    if in_array:
+        reader.advance(1)
+
+    index = 0
+    while True:
+        reader.skip_whitespace()
+        char = reader.peek()
+        if char is None:
+            if in_array:
+                raise ValueError("El array JSON no está cerrado (falta ']').")
+            return
+        if in_array and char == "]":
+            reader.advance(1)
+            reader.skip_whitespace()
+            if reader.peek() is not None:
+                raise ValueError("Contenido inesperado después del array JSON.")
+            return
+        if in_array and index > 0:
+            if char != ",":
+                raise ValueError(f"Se esperaba ',' o ']' después del elemento {index}.")
+            reader.advance(1)
+            reader.skip_whitespace()
+
+        yield reader.decode_value()
+        index += 1
+
+
+class _ChunkReader:
+    """Búfer de texto sobre un stream que se rellena por bloques bajo demanda."""
+
+    def __init__(self, stream, chunk_size: int):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        # utf-8-sig descarta el BOM que añaden algunos editores
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+
+    def _fill(self) -> bool:
+        """Lee un bloque más del stream. Retorna False si ya no hay más datos."""
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if isinstance(chunk, bytes):
+            text = self._decoder.decode(chunk, final=not chunk)
+        else:
+            text = chunk
+        if not chunk:
+            self.eof = True
+        # Descartar lo ya consumido para que el búfer no crezca
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return bool(chunk)
+
+    def peek(self) -> str:
+        """Retorna el siguiente carácter sin consumirlo, o None al final del stream."""
+        while self.pos >= len(self.buffer):
+            if not self._fill():
+                return None
+        return self.buffer[self.pos]
+
+    def advance(self, count: int) -> None:
+        self.pos += count
+
+    def skip_whitespace(self) -> None:
+        while True:
+            char = self.peek()
+            if char is None or char not in _WHITESPACE:
+                return
+            self.pos += 1
+
+    def decode_value(self):
+        """Decodifica el siguiente valor JSON, leyendo más bloques si está incompleto."""
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                # Puede que el valor simplemente no haya llegado entero todavía
+                if self._truncated(e) and self._fill():
+                    continue
+                raise
+            if end == len(self.buffer) and not self.eof and not self.buffer.endswith(("}", "]", '"')):
+                # Un número o literal al final del búfer podría continuar en el siguiente bloque
+                if self._fill():
+                    continue
+            self.pos = end
+            return value
+
+    def _truncated(self, error: json.JSONDecodeError) -> bool:
+        """Indica si el error de decodificación puede deberse a que el búfer corta el valor."""
+        # Una cadena sin cerrar se señala en su comienzo, que puede estar lejos del final
+        return error.msg.startswith("Unterminated string") or error.pos >= len(self.buffer) - _TRUNCATION_MARGIN
+
+
+# ==========================
+#   Registro compacto de tracks
+# ==========================
+
+# Campos reconocidos de cada track; el resto de claves de la entrada se descartan.
+# 'uri' es el URI de Spotify ya resuelto (p. ej. en un manifiesto de resolve_tracks):
+# un track que lo trae no se busca.
+TRACK_FIELDS = ("track", "artist", "album", "year", "upc", "isrc", "tag", "genre", "uri")
+_TRACK_FIELD_SET = frozenset(TRACK_FIELDS)
+# Campos que se repiten mucho dentro de una lista (mismo artista, mismo álbum...):
+# se internan para que todas las apariciones compartan una sola cadena
+_INTERNED_FIELDS = frozenset({"artist", "album", "year", "tag", "genre"})
+# Valor que se muestra en los resúmenes para los campos ausentes
+MISSING = "N/A"
+# URI o enlace de un track de Spotify (spotify:track:ID u open.spotify.com/track/ID)
+_TRACK_URI = re.compile(r"^(?:spotify:track:|https?://open\.spotify\.com/(?:intl-[\w-]+/)?track/)([0-9A-Za-z]{22})(?:[?#].*)?$")
+
+
+def track_uri(value: str) -> str:
+    """Retorna el URI canónico (spotify:track:ID) de un URI o enlace de track, o None si no lo es."""
+    match = _TRACK_URI.match(value or "")
+    return f"spotify:track:{match.group(1)}" if match else None
+
+
+class TrackRecord:
+    """
+    Track de entrada validado y compacto: un objeto con __slots__ (sin
+    diccionario propio) con los campos de TRACK_FIELDS. Los textos se guardan
+    sin espacios sobrantes, los vacíos como None y los campos repetitivos
+    internados con sys.intern, de modo que una lista de 100k tracks ocupa una
+    fracción de lo que ocupaban los diccionarios originales.
+    Se comporta como un diccionario de solo lectura con los campos presentes
+    (get, [], in, keys, items), así que puede usarse donde se usaba el dict.
+    """
+
+    __slots__ = TRACK_FIELDS
+
+    @classmethod
+    def from_dict(cls, data: dict, index: int = None) -> "TrackRecord":
+        """
+        Crea el registro a partir de un objeto JSON (un TrackRecord se retorna tal cual).
+        Lanza ValueError si no es un objeto, si algún campo no es texto ni número
+        o si 'uri' no es un URI o enlace de track de Spotify (se guarda como spotify:track:ID).
+        """
+        if isinstance(data, cls):
+            return data
+        if not isinstance(data, dict):
+            raise ValueError(f"El elemento {index} no es un objeto JSON.")
+        record = cls.__new__(cls)
+        for name in TRACK_FIELDS:
+            value = data.get(name)
+            if isinstance(value, str):
+                value = " ".join(value.split()) or None
+                if value is not None and name in _INTERNED_FIELDS:
+                    value = sys.intern(value)
+            elif isinstance(value, bool) or not isinstance(value, (int, float, type(None))):
+                raise ValueError(f"El campo '{name}' del elemento {index} debe ser texto o número.")
+            if name == "uri" and value is not None:
+                value = track_uri(str(value))
+                if value is None:
+                    raise ValueError(f"El campo 'uri' del elemento {index} no es un URI de track de Spotify.")
+            setattr(record, name, value)
+        return record
+
+    def get(self, key: str, default=None):
+        value = getattr(self, key) if key in _TRACK_FIELD_SET else None
+        return default if value is None else value
+
+    def __getitem__(self, key: str):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def keys(self) -> list:
+        return [name for name in TRACK_FIELDS if getattr(self, name) is not None]
+
+    def items(self) -> list:
+        return [(name, getattr(self, name)) for name in self.keys()]
+
+    def to_dict(self) -> dict:
+        """Retorna los campos presentes como diccionario."""
+        return dict(self.items())
+
+    def summary(self) -> dict:
+        """Retorna {track, artist, album} para mostrar al usuario (MISSING en los ausentes)."""
+        return {"track": self.get("track", MISSING), "artist": self.get("artist", MISSING),
+                "album": self.get("album", MISSING)}
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, TrackRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in TRACK_FIELDS)
+
+    def __repr__(self) -> str:
+        return f"TrackRecord({self.to_dict()!r})"
@@ -0,0 +1,7 @@
+# Punto de entrada para servidores WSGI de producción, p. ej.:
+#   gunicorn --workers 4 --threads 8 --bind 0.0.0.0:8000 wsgi:app
+# Cada proceso crea su propia aplicación; la clave secreta se comparte vía
+# FLASK_SECRET_KEY o instance/secret_key (ver app.create_app).
+from app import create_app
+
+app = create_app()